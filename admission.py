@@ -0,0 +1,222 @@
+"""
+Admission control for chat turns.
+
+Bounds the number of agent runs in flight, globally and per session, so a
+traffic spike queues at the API instead of fanning out into unbounded
+parallel LLM and tool calls. Requests over the limits wait in a bounded
+queue that is served round-robin across sessions, so one busy session
+can't starve the rest; once the queue is full, requests are rejected
+right away with a Retry-After estimate.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Tuple
+
+from metrics import admission_queue_depth, admission_rejections, admission_wait
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be queued (or waited too long)."""
+
+    def __init__(self, reason: str, retry_after: int):
+        """
+        Args:
+            reason: "queue_full", "session_queue_full" or "timeout"
+            retry_after: Seconds the client should wait before retrying
+        """
+        super().__init__(f"Server busy ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request's slot; release() it when the turn ends."""
+
+    def __init__(self, controller: "AdmissionController", session_id: str):
+        self._controller = controller
+        self.session_id = session_id
+        self._started_at = time.perf_counter()
+        self._released = False
+
+    def release(self) -> None:
+        """Free the slot (safe to call more than once)."""
+        if not self._released:
+            self._released = True
+            self._controller._release(self.session_id, time.perf_counter() - self._started_at)
+
+
+class AdmissionController:
+    """
+    Concurrency limits with a fair, bounded wait queue.
+
+    A request runs when fewer than max_concurrent requests are running and
+    its session has fewer than max_per_session running. Otherwise it waits
+    in its session's FIFO queue; freed slots go to the sessions with
+    waiting requests in turn. Meant for use from a single event loop.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 16,
+        max_per_session: int = 1,
+        max_queue: int = 64,
+        max_queue_per_session: int = 4,
+        queue_timeout: float = 30.0
+    ):
+        """
+        Args:
+            max_concurrent: Requests running at once across all sessions
+            max_per_session: Requests running at once for one session
+            max_queue: Requests waiting across all sessions
+            max_queue_per_session: Requests waiting for one session
+            queue_timeout: Seconds a request may wait before it is rejected (0 = no limit)
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_session = max(1, max_per_session)
+        self.max_queue = max(0, max_queue)
+        self.max_queue_per_session = max(0, max_queue_per_session)
+        self.queue_timeout = queue_timeout
+
+        self._active = 0
+        self._running: Dict[str, int] = {}
+        # Sessions with waiting (future, enqueued_at) pairs, in round-robin order
+        self._waiters: "OrderedDict[str, Deque[Tuple[asyncio.Future, float]]]" = OrderedDict()
+        self._queued = 0
+        # Moving average of how long an admitted request holds its slot
+        self._avg_run_seconds = 1.0
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+
+    def _has_slot(self, session_id: str) -> bool:
+        return (
+            self._active < self.max_concurrent
+            and self._running.get(session_id, 0) < self.max_per_session
+        )
+
+    def _grant(self, session_id: str, waited: float) -> Ticket:
+        self._active += 1
+        self._running[session_id] = self._running.get(session_id, 0) + 1
+        self._stats["admitted"] += 1
+        self._waits.append(waited)
+        admission_wait.observe(waited)
+        return Ticket(self, session_id)
+
+    def retry_after(self) -> int:
+        """Seconds until a new request would likely be admitted."""
+        backlog = (self._queued + 1) / self.max_concurrent
+        return max(1, math.ceil(self._avg_run_seconds * backlog))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self._stats["timed_out" if reason == "timeout" else "rejected"] += 1
+        admission_rejections.labels(reason).inc()
+        return AdmissionRejected(reason, self.retry_after())
+
+    async def acquire(self, session_id: str) -> Ticket:
+        """
+        Wait for a slot for one request of a session.
+
+        Args:
+            session_id: Session the request belongs to
+
+        Returns:
+            Ticket to release when the request finishes
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait timed out
+        """
+        # Freed slots are handed to eligible waiters immediately, so a free
+        # slot here means nobody queued ahead of this request can use it
+        if self._has_slot(session_id):
+            return self._grant(session_id, 0.0)
+
+        waiters = self._waiters.get(session_id)
+        if self._queued >= self.max_queue:
+            raise self._reject("queue_full")
+        if waiters is not None and len(waiters) >= self.max_queue_per_session:
+            raise self._reject("session_queue_full")
+
+        if waiters is None:
+            waiters = self._waiters[session_id] = deque()
+        future = asyncio.get_running_loop().create_future()
+        waiters.append((future, time.perf_counter()))
+        self._queued += 1
+        self._stats["queued"] += 1
+        admission_queue_depth.set(self._queued)
+
+        try:
+            return await asyncio.wait_for(future, self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            self._abandon(session_id, future)
+            raise self._reject("timeout") from None
+        except asyncio.CancelledError:
+            # Client went away while queued
+            self._abandon(session_id, future)
+            raise
+
+    def _abandon(self, session_id: str, future: asyncio.Future) -> None:
+        """Drop a waiter that gave up, handing back its slot if it had been granted one."""
+        if future.done() and not future.cancelled():
+            future.result().release()
+            return
+        waiters = self._waiters.get(session_id) or ()
+        entry = next((entry for entry in waiters if entry[0] is future), None)
+        if entry is not None:
+            waiters.remove(entry)
+            self._queued -= 1
+            admission_queue_depth.set(self._queued)
+            if not waiters:
+                del self._waiters[session_id]
+
+    def _release(self, session_id: str, held: float) -> None:
+        self._active -= 1
+        running = self._running[session_id] - 1
+        if running:
+            self._running[session_id] = running
+        else:
+            del self._running[session_id]
+        self._avg_run_seconds = 0.8 * self._avg_run_seconds + 0.2 * held
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting requests, one session at a time."""
+        while self._active < self.max_concurrent and self._waiters:
+            for session_id, waiters in self._waiters.items():
+                if self._running.get(session_id, 0) < self.max_per_session:
+                    break
+            else:
+                # Every waiting session is at its own limit
+                break
+
+            future, enqueued_at = waiters.popleft()
+            self._queued -= 1
+            if not waiters:
+                del self._waiters[session_id]
+            else:
+                self._waiters.move_to_end(session_id)
+            if future.done():
+                # Timed out or cancelled; its owner is about to clean up
+                continue
+            future.set_result(self._grant(session_id, time.perf_counter() - enqueued_at))
+        admission_queue_depth.set(self._queued)
+
+    def stats(self) -> Dict[str, Any]:
+        """Running and queued requests, admission counts and recent wait times."""
+        waits = sorted(self._waits)
+        stats: Dict[str, Any] = dict(self._stats)
+        stats.update({
+            "running": self._active,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": self._queued,
+            "max_queue": self.max_queue,
+            "queued_sessions": len(self._waiters),
+            "retry_after": self.retry_after(),
+            "wait_ms": {
+                "avg": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2) if waits else 0.0,
+                "max": round(waits[-1] * 1000, 2) if waits else 0.0,
+            },
+        })
+        return stats
+
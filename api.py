@@ -2,17 +2,85 @@
 FastAPI web service for the LangChain chatbot.
 Run with: uvicorn api:app --reload
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Iterator, Optional, List
 from main import ChatBot
+from admission import AdmissionController, AdmissionRejected, Ticket
+from config import settings
+from sessions import SessionStore, create_history_backend
+from utils import EXPORT_FORMATS
+from tools import file_writer, http_client, tool_cache, warm_tools
+from tracing import trace_store
+import logging
+import metrics
+import asyncio
+import json
 import uuid
 
+settings.configure_logging()
+logger = logging.getLogger(__name__)
+
+# Store active chat sessions (bounded, with LRU and idle-TTL eviction)
+chat_sessions = SessionStore(
+    max_sessions=settings.MAX_SESSIONS,
+    ttl_seconds=settings.SESSION_TTL_SECONDS,
+    sweep_interval=settings.SESSION_SWEEP_INTERVAL
+)
+
+# Limits on concurrent agent runs in this worker (None = unlimited)
+admission = AdmissionController(
+    max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+    max_per_session=settings.ADMISSION_MAX_PER_SESSION,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    max_queue_per_session=settings.ADMISSION_MAX_QUEUE_PER_SESSION,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS
+) if settings.ADMISSION_MAX_CONCURRENT > 0 else None
+
+# Persistent history shared by all workers (None = history lives in memory)
+history_backend = create_history_backend(
+    settings.SESSION_BACKEND,
+    db_path=settings.SESSION_DB_PATH,
+    batch_size=settings.SESSION_WRITE_BATCH_SIZE
+)
+
+
+def _warm_up():
+    """Load the lazily imported LLM client, agent framework and tool libraries."""
+    try:
+        import langchain_google_genai  # noqa: F401
+        import executor  # noqa: F401 (langchain.agents and langchain_community)
+        warm_tools()
+    except Exception as e:
+        logger.error("Error warming up tools: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background workers with the application."""
+    chat_sessions.start_sweeper()
+    if settings.WARM_UP_ON_STARTUP:
+        # Not awaited: the server starts accepting requests right away
+        asyncio.get_running_loop().run_in_executor(None, _warm_up)
+    yield
+    chat_sessions.stop_sweeper()
+    await http_client.close()
+    await asyncio.to_thread(ChatBot.close_context_caches)
+    await asyncio.to_thread(trace_store.close)
+    file_writer.flush()
+    if history_backend is not None:
+        history_backend.close()
+
+
 app = FastAPI(
     title="LangChain AI Agent API",
     description="RESTful API for the LangChain chatbot with tool integration",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware for web clients
@@ -24,10 +92,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store active chat sessions
-chat_sessions = {}
-
-
 class ChatMessage(BaseModel):
     """Single chat message."""
     message: str = Field(..., description="The user's message")
@@ -55,19 +119,126 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "chat": "/chat",
+            "chat_stream": "/chat/stream",
             "new_session": "/session/new",
             "get_session": "/session/{session_id}",
             "clear_session": "/session/{session_id}/clear",
+            "export_session": "/session/{session_id}/export?format=markdown|json|jsonl",
+            "session_trace": "/session/{session_id}/trace",
             "list_sessions": "/sessions",
-            "health": "/health"
+            "health": "/health",
+            "metrics": "/metrics"
         }
     }
 
 
+def _new_session(session_id: str, created_at: Optional[str] = None) -> dict:
+    """Create a session entry and add it to the store."""
+    bot = ChatBot(history_backend=history_backend, session_id=session_id)
+    if created_at is None:
+        created_at = str(uuid.uuid1().time)
+        if history_backend is not None:
+            history_backend.create_session(session_id, created_at)
+        # Nothing to load for a brand-new session
+        bot.chat_history = []
+    
+    session = {
+        "bot": bot,
+        "created_at": created_at
+    }
+    chat_sessions[session_id] = session
+    return session
+
+
+async def _find_session(session_id: str) -> Optional[dict]:
+    """Return a live session, reattaching it from the history backend if needed."""
+    session = chat_sessions.get(session_id)
+    if session is None and history_backend is not None:
+        # Database reads run in a thread so they don't block the event loop
+        created_at = await asyncio.to_thread(history_backend.get_created_at, session_id)
+        if created_at is not None:
+            session = _new_session(session_id, created_at)
+            await asyncio.to_thread(session["bot"]._sync_history)
+    return session
+
+
+async def _get_or_create_session(session_id: Optional[str]) -> tuple:
+    """Return (session_id, bot), creating the session if it doesn't exist."""
+    session_id = session_id or str(uuid.uuid4())
+    
+    session = await _find_session(session_id)
+    if session is None:
+        session = _new_session(session_id)
+    
+    return session_id, session["bot"]
+
+
+async def _get_session_or_404(session_id: str) -> dict:
+    """Return the session for session_id or raise a 404."""
+    session = await _find_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+async def _admit(session_id: str) -> Optional[Ticket]:
+    """Wait for an admission slot, or raise a 429 with Retry-After."""
+    if admission is None:
+        return None
+    try:
+        return await admission.acquire(session_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+async def _release(ticket: Optional[Ticket]):
+    """Give back an admission slot (async so BackgroundTask runs it on the event loop)."""
+    if ticket is not None:
+        ticket.release()
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format a single Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "healthy", "sessions": len(chat_sessions)}
+    health = {
+        "status": "healthy",
+        "sessions": len(chat_sessions),
+        "session_store": chat_sessions.stats(),
+        "tool_cache": tool_cache.stats()
+    }
+    if admission is not None:
+        health["admission"] = admission.stats()
+    if settings.TRACE_ENABLED:
+        health["tracing"] = trace_store.stats()
+    response_cache = ChatBot.get_response_cache()
+    if response_cache is not None:
+        health["response_cache"] = response_cache.stats()
+    context_caches = ChatBot.context_cache_stats()
+    if context_caches:
+        health["context_cache"] = context_caches
+    router = ChatBot.get_router()
+    if router is not None:
+        health["fast_path"] = router.stats()
+    return health
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Latency histograms, counters and gauges in Prometheus text format."""
+    metrics.sessions.set(len(chat_sessions))
+    return PlainTextResponse(
+        metrics.registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 @app.post("/chat", response_model=ChatResponse)
@@ -77,21 +248,17 @@ async def chat(message: ChatMessage):
     
     - **message**: The user's message
     - **session_id**: Optional session ID to continue a conversation
+    
+    Returns 429 with Retry-After when the server is at capacity.
     """
+    session_id = message.session_id or str(uuid.uuid4())
+    ticket = await _admit(session_id)
     try:
         # Get or create session
-        session_id = message.session_id or str(uuid.uuid4())
-        
-        if session_id not in chat_sessions:
-            chat_sessions[session_id] = {
-                "bot": ChatBot(),
-                "created_at": str(uuid.uuid1().time)
-            }
-        
-        bot = chat_sessions[session_id]["bot"]
+        session_id, bot = await _get_or_create_session(session_id)
         
-        # Get response
-        response = bot.chat(message.message)
+        # Get response without blocking the event loop
+        response = await bot.achat(message.message)
         
         return ChatResponse(
             response=response,
@@ -100,16 +267,50 @@ async def chat(message: ChatMessage):
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await _release(ticket)
+
+
+@app.post("/chat/stream")
+async def chat_stream(message: ChatMessage):
+    """
+    Send a message and stream the response as Server-Sent Events.
+    
+    Emits a `session` event first, then `token`, `tool_start` and `tool_end`
+    events as they happen, and finally `done` with the full response
+    (or `error`). Returns 429 with Retry-After when the server is at
+    capacity; the admission slot is held until the stream ends.
+    """
+    session_id = message.session_id or str(uuid.uuid4())
+    ticket = await _admit(session_id)
+    try:
+        session_id, bot = await _get_or_create_session(session_id)
+    except Exception as e:
+        await _release(ticket)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def event_stream():
+        try:
+            yield _sse("session", {"session_id": session_id})
+            async for event in bot.astream_chat(message.message):
+                yield _sse(event["event"], event["data"])
+        finally:
+            await _release(ticket)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also releases the slot if the client disconnects before the stream starts
+        background=BackgroundTask(_release, ticket)
+    )
 
 
 @app.post("/session/new")
 async def create_session():
     """Create a new chat session."""
     session_id = str(uuid.uuid4())
-    chat_sessions[session_id] = {
-        "bot": ChatBot(),
-        "created_at": str(uuid.uuid1().time)
-    }
+    _new_session(session_id)
     
     return {
         "session_id": session_id,
@@ -120,25 +321,20 @@ async def create_session():
 @app.get("/session/{session_id}")
 async def get_session(session_id: str):
     """Get information about a specific session."""
-    if session_id not in chat_sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    bot = chat_sessions[session_id]["bot"]
+    session = await _get_session_or_404(session_id)
+    bot = session["bot"]
     
     return {
         "session_id": session_id,
         "message_count": len(bot.get_history()),
-        "created_at": chat_sessions[session_id]["created_at"]
+        "created_at": session["created_at"]
     }
 
 
 @app.delete("/session/{session_id}/clear")
 async def clear_session(session_id: str):
     """Clear the chat history for a session."""
-    if session_id not in chat_sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    bot = chat_sessions[session_id]["bot"]
+    bot = (await _get_session_or_404(session_id))["bot"]
     bot.clear_history()
     
     return {"message": "Session history cleared"}
@@ -147,10 +343,11 @@ async def clear_session(session_id: str):
 @app.delete("/session/{session_id}")
 async def delete_session(session_id: str):
     """Delete a chat session."""
-    if session_id not in chat_sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    del chat_sessions[session_id]
+    await _get_session_or_404(session_id)
+    chat_sessions.pop(session_id, None)
+    trace_store.clear(session_id)
+    if history_backend is not None:
+        history_backend.delete(session_id)
     
     return {"message": "Session deleted"}
 
@@ -158,6 +355,9 @@ async def delete_session(session_id: str):
 @app.get("/sessions")
 async def list_sessions():
     """List all active sessions."""
+    if history_backend is not None:
+        return {"sessions": await asyncio.to_thread(history_backend.list_sessions)}
+    
     return {
         "sessions": [
             {
@@ -170,27 +370,80 @@ async def list_sessions():
     }
 
 
+# Message type -> role name used in history and exports
+_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+
+
+def _iter_history(bot: ChatBot, full: bool = False) -> Iterator[dict]:
+    """
+    Yield a bot's history as role/content dictionaries.
+    
+    With full=True and a history backend, every stored message is streamed
+    from the backend page by page; otherwise the recent window is used.
+    """
+    if full and bot.history_backend is not None:
+        messages = bot.history_backend.iter_messages(bot.session_id)
+    else:
+        # Snapshot the message list (not the messages) so a concurrent turn
+        # can't shift it mid-iteration
+        messages = list(bot.get_history())
+    for msg in messages:
+        yield {
+            "role": _ROLES.get(msg.type, msg.type),
+            "content": msg.content
+        }
+
+
 @app.get("/session/{session_id}/history")
 async def get_history(session_id: str):
     """Get the chat history for a session."""
-    if session_id not in chat_sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
+    bot = (await _get_session_or_404(session_id))["bot"]
     
-    bot = chat_sessions[session_id]["bot"]
-    history = bot.get_history()
+    return {
+        "session_id": session_id,
+        "history": list(_iter_history(bot))
+    }
+
+
+@app.get("/session/{session_id}/trace")
+async def get_trace(session_id: str):
+    """Get the recorded spans of a session's recent turns, oldest first."""
+    await _get_session_or_404(session_id)
     
     return {
         "session_id": session_id,
-        "history": [
-            {
-                "role": "user" if i % 2 == 0 else "assistant",
-                "content": msg.content
-            }
-            for i, msg in enumerate(history)
-        ]
+        "spans": trace_store.get(session_id)
     }
 
 
+@app.get("/session/{session_id}/export")
+async def export_session(session_id: str, format: str = "markdown"):
+    """
+    Stream a session's history as Markdown, JSON or JSON Lines.
+    
+    With a history backend the whole conversation is exported; with
+    in-memory sessions only the recent history window is kept.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown export format: {format} (choose from {', '.join(EXPORT_FORMATS)})"
+        )
+    bot = (await _get_session_or_404(session_id))["bot"]
+    render, media_type, extension = EXPORT_FORMATS[format]
+    
+    if format == "markdown":
+        chunks = render(_iter_history(bot, full=True), title=f"Session {session_id}")
+    else:
+        chunks = render(_iter_history(bot, full=True))
+    
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="session_{session_id}{extension}"'}
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,229 @@
+"""
+Append-only conversation archive: JSONL segments plus an offset index.
+
+Each conversation is one record appended to the current segment file
+(segment-000001.jsonl, optionally .jsonl.gz or .jsonl.zst). With
+compression every record is its own gzip member / zstd frame, so the
+segment is still a valid compressed stream and any record can be read on
+its own. index.tsv maps conversation ids to (segment, offset, length);
+loading a conversation is one seek and one read.
+"""
+import gzip
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+INDEX_FILE = "index.tsv"
+
+_EXTENSIONS = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+class IndexEntry(NamedTuple):
+    """Location of one record."""
+    segment: int
+    offset: int
+    length: int
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression requires the zstandard package: pip install zstandard")
+    return zstandard
+
+
+class ConversationArchive:
+    """
+    Append-only, segmented store of conversations.
+
+    Writes are serialized by a lock; reads only need the in-memory index.
+    A segment is closed for writing once it reaches max_segment_bytes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        compression: Optional[str] = None,
+        max_segment_bytes: int = 64 * 1024 * 1024
+    ):
+        """
+        Open (and create if needed) an archive.
+
+        Args:
+            directory: Directory holding segments and the index
+            compression: None, "gzip" or "zstd" for newly written segments
+            max_segment_bytes: Size at which a new segment is started
+        """
+        if compression in ("none", ""):
+            compression = None
+        if compression not in _EXTENSIONS:
+            raise ValueError(f"Unknown archive compression: {compression}")
+        if compression == "zstd":
+            _zstd()
+
+        self.directory = directory
+        self.compression = compression
+        self.max_segment_bytes = max_segment_bytes
+        self._lock = threading.Lock()
+        self._index: Dict[str, IndexEntry] = {}
+        self._segment_files: Dict[int, str] = {}
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+        self._segment = max((entry.segment for entry in self._index.values()), default=1)
+        existing = self._find_segment(self._segment)
+        if existing is not None and existing != self._path_for(self._segment):
+            # Compression changed since the last run: start a fresh segment
+            self._segment += 1
+        self._segment_path = self._path_for(self._segment)
+        self._segment_size = os.path.getsize(self._segment_path) if os.path.exists(self._segment_path) else 0
+
+    # Paths and index
+
+    def _path_for(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:06d}{_EXTENSIONS[self.compression]}")
+
+    def _find_segment(self, segment: int) -> Optional[str]:
+        """Return the existing file for a segment number, whatever its compression."""
+        path = self._segment_files.get(segment)
+        if path is not None:
+            return path
+        for extension in _EXTENSIONS.values():
+            path = os.path.join(self.directory, f"segment-{segment:06d}{extension}")
+            if os.path.exists(path):
+                self._segment_files[segment] = path
+                return path
+        return None
+
+    def _load_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            # Drop a torn last line left by a crash so new entries start cleanly
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+
+        for line in data[:end].decode("utf-8").splitlines():
+            parts = line.split("\t")
+            if len(parts) != 4:
+                continue
+            conversation_id, segment, offset, length = parts
+            self._index.pop(conversation_id, None)
+            self._index[conversation_id] = IndexEntry(int(segment), int(offset), int(length))
+
+    # Encoding
+
+    def _encode(self, record: Dict[str, Any]) -> bytes:
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if self.compression == "gzip":
+            return gzip.compress(data)
+        if self.compression == "zstd":
+            return _zstd().ZstdCompressor().compress(data)
+        return data
+
+    @staticmethod
+    def _decode(data: bytes, path: str) -> Dict[str, Any]:
+        if path.endswith(".gz"):
+            data = gzip.decompress(data)
+        elif path.endswith(".zst"):
+            data = _zstd().ZstdDecompressor().decompress(data)
+        return json.loads(data)
+
+    # Public API
+
+    def append(
+        self,
+        conversation: List[Dict[str, str]],
+        conversation_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Append a conversation.
+
+        Args:
+            conversation: List of message dictionaries with 'role' and 'content'
+            conversation_id: Optional id (a new one is generated otherwise);
+                appending an existing id supersedes the earlier record
+            metadata: Optional extra fields stored with the record
+
+        Returns:
+            The conversation id
+        """
+        conversation_id = conversation_id or uuid.uuid4().hex
+        if "\t" in conversation_id or "\n" in conversation_id:
+            raise ValueError("Conversation ids cannot contain tabs or newlines")
+        record = {
+            "id": conversation_id,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "metadata": metadata or {},
+            "messages": conversation,
+        }
+
+        data = self._encode(record)
+
+        with self._lock:
+            if self._segment_size and self._segment_size + len(data) > self.max_segment_bytes:
+                self._segment += 1
+                self._segment_path = self._path_for(self._segment)
+                self._segment_size = 0
+
+            with open(self._segment_path, "ab") as f:
+                f.write(data)
+            entry = IndexEntry(self._segment, self._segment_size, len(data))
+            self._segment_size += len(data)
+            with open(os.path.join(self.directory, INDEX_FILE), "a", encoding="utf-8") as f:
+                f.write(f"{conversation_id}\t{entry.segment}\t{entry.offset}\t{entry.length}\n")
+            self._index.pop(conversation_id, None)
+            self._index[conversation_id] = entry
+
+        return conversation_id
+
+    def get(self, conversation_id: str) -> Dict[str, Any]:
+        """
+        Read one record (id, created, metadata, messages).
+
+        Raises:
+            KeyError: If the id isn't in the archive
+        """
+        entry = self._index[conversation_id]
+        path = self._find_segment(entry.segment)
+        if path is None:
+            raise KeyError(conversation_id)
+        with open(path, "rb") as f:
+            f.seek(entry.offset)
+            data = f.read(entry.length)
+        return self._decode(data, path)
+
+    def load(self, conversation_id: str) -> List[Dict[str, str]]:
+        """Return the messages of one conversation."""
+        return self.get(conversation_id)["messages"]
+
+    def ids(self) -> List[str]:
+        """Ids of all archived conversations, oldest first."""
+        return list(self._index)
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Yield every record, oldest first."""
+        for conversation_id in self.ids():
+            yield self.get(conversation_id)
+
+    def segments(self) -> List[str]:
+        """Paths of the segment files, in order."""
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith("segment-")
+        )
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
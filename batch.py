@@ -0,0 +1,172 @@
+"""
+Bulk processing of JSONL prompt files.
+
+Each input line is a JSON object with a "prompt" (or "input") and an
+optional "id"; lines without an id are keyed by their line number. Every
+prompt gets its own ChatBot, so histories are independent. Results are
+appended to the output file as they complete, which doubles as the
+checkpoint: re-running with the same output file skips prompts that
+already have a response. A failed turn is retried with exponential
+backoff and then recorded as an error, so the next run tries it again.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Set, TextIO, Tuple
+
+
+def load_completed_ids(output_path: str) -> Set[str]:
+    """
+    Read the ids already answered in an output file.
+
+    A trailing partial line left by a crash is truncated so new results
+    start on a fresh line.
+
+    Args:
+        output_path: Path to the output JSONL file (may not exist)
+
+    Returns:
+        Ids of records that have a response
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if "response" in record and "error" not in record:
+            completed.add(str(record["id"]))
+    return completed
+
+
+def iter_prompts(input_file: TextIO) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    Lazily parse prompts from an open JSONL file.
+
+    Yields:
+        (id, prompt, error) tuples; prompt is None when the line is invalid
+    """
+    for line_number, line in enumerate(input_file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield str(line_number), None, f"Invalid JSON: {str(e)}"
+            continue
+        if not isinstance(record, dict):
+            record = {"prompt": record}
+        prompt_id = str(record.get("id", line_number))
+        prompt = record.get("prompt", record.get("input"))
+        if not isinstance(prompt, str) or not prompt.strip():
+            yield prompt_id, None, "Missing prompt"
+        else:
+            yield prompt_id, prompt, None
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    concurrency: int = 8,
+    bot_factory: Optional[Callable[[], Any]] = None,
+    report_every: int = 100,
+    report: Callable[[str], None] = print,
+    retries: int = 2,
+    retry_backoff: float = 1.0
+) -> Dict[str, Any]:
+    """
+    Answer every prompt in a JSONL file with bounded concurrency.
+
+    Args:
+        input_path: JSONL file of prompts
+        output_path: JSONL file results are appended to (and resumed from)
+        concurrency: Maximum prompts in flight at once
+        bot_factory: Callable returning a fresh ChatBot per prompt
+        report_every: Print progress after this many completed prompts
+        report: Function receiving progress lines
+        retries: Extra attempts for a prompt whose turn fails
+        retry_backoff: Seconds before the first retry (doubled for each one after)
+
+    Returns:
+        Run statistics: processed, failed, retried, skipped, elapsed_s and prompts_per_s
+    """
+    if bot_factory is None:
+        from main import ChatBot
+        bot_factory = ChatBot
+
+    completed = load_completed_ids(output_path)
+    stats = {"processed": 0, "failed": 0, "retried": 0, "skipped": 0}
+    start = time.perf_counter()
+
+    def throughput() -> float:
+        elapsed = time.perf_counter() - start
+        return stats["processed"] / elapsed if elapsed else 0.0
+
+    with open(input_path, "r", encoding="utf-8") as input_file, \
+            open(output_path, "a", encoding="utf-8") as output_file:
+        prompts = iter_prompts(input_file)
+
+        def write(record: Dict[str, Any]):
+            output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output_file.flush()
+
+        async def answer(prompt: str) -> Tuple[Optional[str], Optional[str], int]:
+            """Run a prompt (retrying failures); returns (response, error, attempts)."""
+            for attempt in range(max(0, retries) + 1):
+                if attempt:
+                    stats["retried"] += 1
+                    await asyncio.sleep(retry_backoff * 2 ** (attempt - 1))
+                try:
+                    # A fresh bot per attempt, so a failed turn leaves no history behind
+                    return await bot_factory().achat(prompt, raise_errors=True), None, attempt + 1
+                except Exception as e:
+                    error = f"{type(e).__name__}: {str(e)}"
+            return None, error, attempt + 1
+
+        async def worker():
+            # Workers pull from one shared iterator, so input is read lazily
+            # and at most `concurrency` prompts are in flight
+            for prompt_id, prompt, error in prompts:
+                if prompt_id in completed:
+                    stats["skipped"] += 1
+                    continue
+
+                record = {"id": prompt_id, "prompt": prompt}
+                if error is None:
+                    turn_start = time.perf_counter()
+                    response, error, attempts = await answer(prompt)
+                    if error is None:
+                        record["response"] = response
+                    if attempts > 1:
+                        record["attempts"] = attempts
+                    record["elapsed_s"] = round(time.perf_counter() - turn_start, 4)
+                if error is not None:
+                    record["error"] = error
+                    stats["failed"] += 1
+                write(record)
+
+                stats["processed"] += 1
+                if report_every and stats["processed"] % report_every == 0:
+                    report(f"Processed {stats['processed']} prompts ({throughput():.2f}/s)")
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+    stats["elapsed_s"] = round(time.perf_counter() - start, 4)
+    stats["prompts_per_s"] = round(throughput(), 2)
+    report(
+        f"Done: {stats['processed']} processed, {stats['failed']} failed "
+        f"({stats['retried']} retries), "
+        f"{stats['skipped']} already done, {stats['prompts_per_s']} prompts/s"
+    )
+    return stats
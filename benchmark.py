@@ -0,0 +1,552 @@
+"""
+Offline benchmarks for the LangChain chatbot.
+Run with: python benchmark.py [benchmark ...] [--json results.json] [--compare baseline.json]
+
+Benchmarks use the deterministic fake model and tools from fakes.py (or
+construct real clients without calling them), so no API key or network
+access is required. Save results from one commit with --json and check
+another against them with --compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from fakes import FakeChatModel, make_fake_tool
+from main import ChatBot
+from tools import all_tools
+
+
+def _placeholder_api_key():
+    """Client construction doesn't touch the network; any key will do."""
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark-placeholder-key")
+
+
+def make_bot(latency: float = 0.0) -> ChatBot:
+    """Create a quiet ChatBot backed by the fake model."""
+    bot = ChatBot(llm=FakeChatModel(latency=latency))
+    bot.agent_executor.verbose = False
+    return bot
+
+
+def bench_concurrent_chat(sessions: int = 20, latency: float = 0.1) -> Dict[str, Any]:
+    """
+    Compare blocking vs async chat turns issued concurrently from one event loop.
+
+    The blocking variant calls ChatBot.chat() inside coroutines, which is what
+    the /chat handler used to do; every turn holds the loop for its full
+    latency. The async variant awaits ChatBot.achat(), so turns overlap.
+    """
+    bots = [make_bot(latency) for _ in range(sessions)]
+
+    async def blocking():
+        async def turn(bot):
+            return bot.chat("Hello")
+        await asyncio.gather(*(turn(bot) for bot in bots))
+
+    async def non_blocking():
+        await asyncio.gather(*(bot.achat("Hello") for bot in bots))
+
+    start = time.perf_counter()
+    asyncio.run(blocking())
+    blocking_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    asyncio.run(non_blocking())
+    async_s = time.perf_counter() - start
+
+    return {
+        "sessions": sessions,
+        "llm_latency_s": latency,
+        "blocking_s": round(blocking_s, 4),
+        "async_s": round(async_s, 4),
+        "speedup": round(blocking_s / async_s, 2),
+    }
+
+
+def bench_session_creation(sessions: int = 200) -> Dict[str, Any]:
+    """
+    Compare per-session construction cost with and without the shared agent.
+
+    "dedicated" rebuilds the Gemini client and agent for every session (the
+    old ChatBot behaviour); "shared" is the current ChatBot(). Reports mean
+    construction time and retained memory per session.
+    """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    _placeholder_api_key()
+
+    def dedicated():
+        llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-exp", temperature=0.7)
+        return llm, ChatBot._create_agent(llm, all_tools), []
+
+    def shared():
+        return ChatBot()
+
+    ChatBot()  # Warm the shared agent so it isn't charged to the first session
+    results: Dict[str, Any] = {"sessions": sessions}
+    for label, factory in (("dedicated", dedicated), ("shared", shared)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        kept = [factory() for _ in range(sessions)]
+        elapsed = time.perf_counter() - start
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del kept
+
+        results[f"{label}_us_per_session"] = round(elapsed / sessions * 1e6, 1)
+        results[f"{label}_bytes_per_session"] = retained // sessions
+
+    return results
+
+
+def bench_history_appends(appends: int = 5000, batch_sizes=(1, 10, 100, 1000)) -> Dict[str, Any]:
+    """
+    Measure SQLite history append throughput at different write-behind batch sizes.
+
+    Each append is one user/AI exchange; the clock stops once everything is
+    committed.
+    """
+    from langchain_core.messages import AIMessage, HumanMessage
+    from sessions import SQLiteHistoryBackend
+
+    exchange = [HumanMessage(content="What is the capital of France?"), AIMessage(content="Paris.")]
+    results: Dict[str, Any] = {"appends": appends}
+
+    for batch_size in batch_sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteHistoryBackend(os.path.join(tmp, "sessions.db"), batch_size=batch_size)
+            start = time.perf_counter()
+            for i in range(appends):
+                backend.append(f"session-{i % 100}", exchange)
+            backend.flush()
+            elapsed = time.perf_counter() - start
+            backend.close()
+
+        results[f"batch_{batch_size}_appends_per_s"] = round(appends / elapsed)
+
+    return results
+
+
+def bench_history_trimming(lengths=(100, 1000, 10000), turns: int = 200) -> Dict[str, Any]:
+    """
+    Per-turn cost of token-budgeted history trimming at long history lengths.
+
+    "recount" re-tokenizes the whole history every turn (what a naive
+    token budget does); "cached" is HistoryWindow, which counts each
+    message once. The budget is sized so the window holds about `length`
+    messages, so every turn evicts the oldest exchange.
+    """
+    from langchain_core.messages import AIMessage, HumanMessage
+    from memory import HistoryWindow, MESSAGE_OVERHEAD_TOKENS, estimate_tokens
+
+    def exchange(i):
+        return [
+            HumanMessage(content=f"Question {i}: what happened in the year {1900 + i % 100}?"),
+            AIMessage(content=f"Answer {i}: several notable events took place, including a few elections."),
+        ]
+
+    results: Dict[str, Any] = {"turns": turns}
+    for length in lengths:
+        history = [msg for i in range(length // 2) for msg in exchange(i)]
+        budget = sum(estimate_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS for m in history)
+
+        # Naive: recount everything every turn
+        messages = list(history)
+        start = time.perf_counter()
+        for turn in range(turns):
+            messages.extend(exchange(length + turn))
+            counts = [estimate_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS for m in messages]
+            total, drop = sum(counts), 0
+            while total > budget:
+                total -= counts[drop]
+                drop += 1
+            messages = messages[drop:]
+        recount_s = time.perf_counter() - start
+
+        # Cached counts
+        window = HistoryWindow(max_tokens=budget)
+        window.extend(history)
+        start = time.perf_counter()
+        for turn in range(turns):
+            window.extend(exchange(length + turn))
+            window.trim()
+        cached_s = time.perf_counter() - start
+
+        results[f"len_{length}_recount_us_per_turn"] = round(recount_s / turns * 1e6, 1)
+        results[f"len_{length}_cached_us_per_turn"] = round(cached_s / turns * 1e6, 1)
+
+    return results
+
+
+def _us_per_call(fn: Callable[[], Any], number: int) -> float:
+    """Mean microseconds per call of fn over number calls."""
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return round((time.perf_counter() - start) / number * 1e6, 2)
+
+
+def bench_chatbot_construction(bots: int = 200) -> Dict[str, Any]:
+    """
+    Cost of constructing a ChatBot around a fake model.
+
+    "shared" reuses the cached agent (the API path); "injected_llm" builds
+    a dedicated agent for the given model, as tests and batch jobs do.
+    """
+    _placeholder_api_key()
+    ChatBot()  # Warm the shared agent
+    llm = FakeChatModel()
+    return {
+        "bots": bots,
+        "shared_us": _us_per_call(ChatBot, bots),
+        "injected_llm_us": _us_per_call(lambda: ChatBot(llm=llm), bots),
+    }
+
+
+def bench_chat_overhead(turns: int = 200) -> Dict[str, Any]:
+    """
+    Framework overhead of one chat turn with a zero-latency model.
+
+    "model_only" calls the fake model directly; the difference to
+    "chat"/"achat" is what prompt building, agent parsing and history
+    bookkeeping cost per turn.
+    """
+    llm = FakeChatModel()
+    bot = make_bot()
+    bot.history_window.max_messages = 20  # Keep the prompt size steady
+
+    async def async_turns():
+        for _ in range(turns):
+            await bot.achat("Hello there")
+
+    start = time.perf_counter()
+    asyncio.run(async_turns())
+    achat_us = round((time.perf_counter() - start) / turns * 1e6, 2)
+
+    return {
+        "turns": turns,
+        "model_only_us": _us_per_call(lambda: llm.invoke("Hello there"), turns),
+        "chat_us": _us_per_call(lambda: bot.chat("Hello there"), turns),
+        "achat_us": achat_us,
+    }
+
+
+def bench_tool_dispatch(latency: float = 0.05, tools: int = 4, runs: int = 5) -> Dict[str, Any]:
+    """
+    Wall time of one agent run whose first LLM turn calls several tools.
+
+    Compares the stock sequential AgentExecutor with ConcurrentAgentExecutor
+    (sync and async), plus the per-call overhead of a no-op tool.
+    """
+    from langchain.agents import AgentExecutor
+    from langchain_core.messages import AIMessage
+
+    fake_tools = [make_fake_tool(f"Tool{i}", latency) for i in range(tools)]
+    turn = AIMessage(content="", tool_calls=[
+        {"name": tool.name, "args": {"__arg1": "q"}, "id": f"call_{i}"} for i, tool in enumerate(fake_tools)
+    ])
+
+    def executor():
+        agent_executor = ChatBot._create_agent(FakeChatModel(responses=[turn, "Done."]), fake_tools)
+        agent_executor.verbose = False
+        return agent_executor
+
+    concurrent = executor()
+    sequential = AgentExecutor(agent=concurrent.agent, tools=fake_tools, max_iterations=5)
+    inputs = {"input": "go", "chat_history": []}
+
+    def timed(fn) -> float:
+        start = time.perf_counter()
+        for _ in range(runs):
+            fn()
+        return round((time.perf_counter() - start) / runs * 1000, 2)
+
+    noop = make_fake_tool("Noop")
+    return {
+        "tools_per_turn": tools,
+        "tool_latency_s": latency,
+        "sequential_ms": timed(lambda: sequential.invoke(inputs)),
+        "concurrent_ms": timed(lambda: concurrent.invoke(inputs)),
+        "concurrent_async_ms": timed(lambda: asyncio.run(concurrent.ainvoke(inputs))),
+        "noop_tool_call_us": _us_per_call(lambda: noop.invoke("q"), 1000),
+    }
+
+
+def bench_import_time(modules=("tools", "main", "api"), runs: int = 3) -> Dict[str, Any]:
+    """
+    Cold import cost of the entry-point modules, in fresh interpreters.
+
+    Runs `python -X importtime -c "import <module>"` and reports the best
+    wall time of `runs` attempts plus the cumulative time the interpreter
+    attributes to the module and to the heaviest third-party packages, so a
+    new eager import shows up as a regression.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    watched = ("langchain_google_genai", "langchain_community", "numpy")
+    results: Dict[str, Any] = {"runs": runs}
+
+    for module in modules:
+        best_wall, best_cumulative = None, {}
+        for _ in range(runs):
+            start = time.perf_counter()
+            proc = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                capture_output=True, text=True, cwd=here
+            )
+            wall = time.perf_counter() - start
+            if proc.returncode != 0:
+                raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+            # Lines look like "import time:  self [us] | cumulative | imported package"
+            cumulative = {}
+            for line in proc.stderr.splitlines():
+                if not line.startswith("import time:") or "|" not in line:
+                    continue
+                _, total, name = line.split("|")
+                name = name.strip()
+                if name in watched + (module,) and total.strip().isdigit():
+                    cumulative[name] = int(total)
+            if best_wall is None or wall < best_wall:
+                best_wall, best_cumulative = wall, cumulative
+
+        results[f"{module}_wall_ms"] = round(best_wall * 1000, 1)
+        results[f"{module}_import_ms"] = round(best_cumulative.get(module, 0) / 1000, 1)
+        for name in watched:
+            if name in best_cumulative:
+                results[f"{module}_{name}_ms"] = round(best_cumulative[name] / 1000, 1)
+
+    return results
+
+
+def bench_utils(number: int = 2000, files: int = 200) -> Dict[str, Any]:
+    """Per-call cost of the helpers in utils.py."""
+    import utils
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    text = "LangChain is a framework for developing applications powered by language models. " * 20
+    messages = [HumanMessage(content=text), AIMessage(content=text)] * 10
+    conversation = [{"role": "user", "content": text}, {"role": "assistant", "content": text}] * 10
+
+    results: Dict[str, Any] = {
+        "truncate_text_us": _us_per_call(lambda: utils.truncate_text(text, 100), number),
+        "count_tokens_estimate_us": _us_per_call(lambda: utils.count_tokens_estimate(text), number),
+        "format_message_history_us": _us_per_call(lambda: utils.format_message_history(messages), number),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(files):
+            utils.save_conversation(conversation, filename=f"conversation_{i}.json", output_dir=tmp)
+        results["save_conversation_us"] = _us_per_call(
+            lambda: utils.save_conversation(conversation, filename="bench.json", output_dir=tmp), 200
+        )
+        path = os.path.join(tmp, "bench.json")
+        results["load_conversation_us"] = _us_per_call(lambda: utils.load_conversation(path), 200)
+        results["export_to_markdown_us"] = _us_per_call(
+            lambda: utils.export_to_markdown(conversation, output_dir=tmp), 200
+        )
+        results[f"list_saved_conversations_{files}_files_us"] = _us_per_call(
+            lambda: utils.list_saved_conversations(tmp), 20
+        )
+
+    return results
+
+
+def _listdir_listing(output_dir: str) -> List[Dict[str, Any]]:
+    """The original list_saved_conversations: listdir plus three stats per file."""
+    import utils
+
+    conversations = []
+    for filename in os.listdir(output_dir):
+        if filename.endswith('.json'):
+            filepath = os.path.join(output_dir, filename)
+            conversations.append({
+                'filename': filename,
+                'filepath': filepath,
+                'size': utils.get_file_size(filepath),
+                'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S')
+            })
+    conversations.sort(key=lambda x: x['modified'], reverse=True)
+    return conversations
+
+
+def bench_output_files(files: int = 100_000, page: int = 50) -> Dict[str, Any]:
+    """
+    Listing and cleaning a large output directory.
+    
+    "listdir" is the original implementation; "scandir" lists everything
+    with one stat per entry, "page" fetches only the newest page, and
+    "clean" deletes every file in batches.
+    """
+    import utils
+
+    results: Dict[str, Any] = {"files": files}
+    old = time.time() - 60 * 24 * 60 * 60
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(files):
+            path = os.path.join(tmp, f"conversation_{i:06d}.json")
+            with open(path, "w") as f:
+                f.write("[]")
+            os.utime(path, (old + i, old + i))
+
+        def timed(fn) -> float:
+            start = time.perf_counter()
+            fn()
+            return round(time.perf_counter() - start, 3)
+
+        results["listdir_s"] = timed(lambda: _listdir_listing(tmp))
+        results["scandir_s"] = timed(lambda: utils.list_saved_conversations(tmp))
+        results["page_s"] = timed(lambda: utils.list_saved_conversations(tmp, limit=page))
+        results["scandir_speedup"] = round(results["listdir_s"] / max(results["scandir_s"], 1e-9), 2)
+        results["page_speedup"] = round(results["listdir_s"] / max(results["page_s"], 1e-9), 2)
+        results["clean_s"] = timed(lambda: utils.clean_old_files(tmp, days_old=30))
+
+    return results
+
+
+BENCHMARKS: Dict[str, Callable[[], Dict[str, Any]]] = {
+    "concurrent_chat": bench_concurrent_chat,
+    "session_creation": bench_session_creation,
+    "chatbot_construction": bench_chatbot_construction,
+    "chat_overhead": bench_chat_overhead,
+    "history_appends": bench_history_appends,
+    "history_trimming": bench_history_trimming,
+    "tool_dispatch": bench_tool_dispatch,
+    "import_time": bench_import_time,
+    "utils": bench_utils,
+    "output_files": bench_output_files,
+}
+
+# Metric name suffixes where a larger value is better; for the rest
+# (times, bytes) smaller is better
+HIGHER_IS_BETTER = ("_per_s", "speedup")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names: List[str]) -> Dict[str, Any]:
+    """
+    Run benchmarks by name.
+
+    Returns:
+        Report with "meta" (commit, Python version, time) and "results"
+    """
+    results = {}
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name} (choose from {', '.join(BENCHMARKS)})")
+            continue
+        results[name] = BENCHMARKS[name]()
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def compare_results(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    tolerance: float = 0.25
+) -> List[Dict[str, Any]]:
+    """
+    Compare two benchmark reports metric by metric.
+
+    Only numeric metrics present in both reports are compared; input sizes
+    (metrics that didn't change) come out as unchanged.
+
+    Args:
+        baseline: Report from run_benchmarks (or its saved JSON)
+        current: Report to check against the baseline
+        tolerance: Relative change treated as noise
+
+    Returns:
+        One dict per metric with benchmark, metric, baseline, current,
+        change (relative) and status ("better", "worse" or "same")
+    """
+    rows = []
+    for name, metrics in current["results"].items():
+        base_metrics = baseline["results"].get(name, {})
+        for metric, value in metrics.items():
+            base = base_metrics.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or not base:
+                continue
+            change = (value - base) / abs(base)
+            if metric.endswith(HIGHER_IS_BETTER):
+                change_for_better = change
+            else:
+                change_for_better = -change
+            if abs(change) <= tolerance:
+                status = "same"
+            else:
+                status = "better" if change_for_better > 0 else "worse"
+            rows.append({
+                "benchmark": name,
+                "metric": metric,
+                "baseline": base,
+                "current": value,
+                "change": round(change, 4),
+                "status": status,
+            })
+    return rows
+
+
+def main(argv=None):
+    """Run the selected benchmarks (all by default), print, save and compare the results."""
+    parser = argparse.ArgumentParser(description="Offline chatbot benchmarks")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--json", metavar="PATH", help="Save results to a JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against results saved with --json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Relative change ignored as noise")
+    args = parser.parse_args(argv if argv is not None else sys.argv[1:])
+
+    report = run_benchmarks(args.names or list(BENCHMARKS))
+    for name, result in report["results"].items():
+        print(f"\n{name}")
+        for key, value in result.items():
+            print(f"  {key}: {value}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.json}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare_results(baseline, report, args.tolerance)
+        print(f"\nCompared with {args.compare} (commit {baseline['meta'].get('commit')})")
+        for row in rows:
+            if row["status"] != "same":
+                print(
+                    f"  {row['status'].upper():6} {row['benchmark']}.{row['metric']}: "
+                    f"{row['baseline']} -> {row['current']} ({row['change']:+.0%})"
+                )
+        worse = sum(row["status"] == "worse" for row in rows)
+        print(f"  {len(rows)} metrics compared, {worse} regressed")
+        return 1 if worse else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
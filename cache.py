@@ -0,0 +1,516 @@
+"""
+Caching and request coalescing for tool results.
+"""
+import asyncio
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sentinel distinguishing "not cached" from a cached None
+MISSING = object()
+
+
+def normalize_query(query: Any) -> str:
+    """
+    Normalize a tool query so trivially different spellings share a cache key.
+
+    Args:
+        query: Raw tool input
+
+    Returns:
+        Case-folded query with collapsed whitespace and no surrounding punctuation
+    """
+    text = " ".join(str(query).casefold().split())
+    return text.strip(" \"'`.,;:!?")
+
+
+def cache_key(tool_name: str, query: Any) -> str:
+    """Build the cache/coalescing key for a tool query."""
+    return f"{tool_name}:{normalize_query(query)}"
+
+
+class _Call:
+    """An in-flight call whose result is shared by every waiter."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _AsyncCall:
+    """An in-flight async call and the number of callers awaiting it."""
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one upstream call.
+
+    While a call for a key is running, further callers with the same key
+    wait for it and receive its result (or exception) instead of starting
+    their own. Sync callers block on a threading.Event; async callers await
+    an asyncio future, and share the call with sync callers when the
+    underlying function is synchronous.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        # (event loop, key) -> call shared by async callers on that loop
+        self._async_calls: Dict[Tuple[int, str], _AsyncCall] = {}
+        self._coalesced = 0
+
+    @property
+    def coalesced(self) -> int:
+        """Number of calls that were served by another caller's request."""
+        return self._coalesced
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn() once for all concurrent callers with the same key.
+
+        Args:
+            key: Identity of the call
+            fn: Zero-argument function performing the upstream call
+
+        Returns:
+            The shared result
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Async version of do().
+
+        A synchronous fn runs once in a worker thread through do(), so it is
+        also shared with concurrent sync callers. A coroutine function is
+        awaited directly. The call runs as its own task that every caller
+        awaits through a shield, so a caller being cancelled (a timeout, a
+        client disconnect) only abandons its own wait; the task is cancelled
+        once no caller is left. If the task itself is cancelled, waiting
+        callers retry instead of inheriting the cancellation.
+
+        Args:
+            key: Identity of the call
+            fn: Zero-argument function or coroutine function
+
+        Returns:
+            The shared result
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+
+        while True:
+            call = self._async_calls.get(flight_key)
+            if call is None:
+                call = self._async_calls[flight_key] = _AsyncCall(loop.create_task(self._acall(key, fn)))
+                call.task.add_done_callback(functools.partial(self._async_done, flight_key, call))
+            else:
+                self._coalesced += 1
+
+            call.waiters += 1
+            try:
+                return await asyncio.shield(call.task)
+            except asyncio.CancelledError:
+                if not call.task.cancelled():
+                    # This caller was cancelled; the call carries on for the others
+                    raise
+                # The shared call was cancelled, not this caller: start over
+                self._forget(flight_key, call)
+            finally:
+                call.waiters -= 1
+                if call.waiters == 0 and not call.task.done():
+                    # Nobody is waiting for the result any more
+                    self._forget(flight_key, call)
+                    call.task.cancel()
+
+    async def _acall(self, key: str, fn: Callable[[], Any]) -> Any:
+        if asyncio.iscoroutinefunction(fn):
+            return await fn()
+        return await asyncio.to_thread(self.do, key, fn)
+
+    def _forget(self, flight_key: Tuple[int, str], call: "_AsyncCall") -> None:
+        if self._async_calls.get(flight_key) is call:
+            del self._async_calls[flight_key]
+
+    def _async_done(self, flight_key: Tuple[int, str], call: "_AsyncCall", task: asyncio.Task) -> None:
+        self._forget(flight_key, call)
+        if not task.cancelled():
+            # Retrieve it so an exception nobody else awaited isn't logged
+            task.exception()
+
+    def wrap(self, tool_name: str, func: Callable[[str], Any]) -> Callable[[str], Any]:
+        """Wrap a single-input tool function so identical queries coalesce."""
+        def coalesced(query: str) -> Any:
+            return self.do(cache_key(tool_name, query), functools.partial(func, query))
+
+        coalesced.__name__ = getattr(func, "__name__", tool_name)
+        return coalesced
+
+    def awrap(self, tool_name: str, func: Callable[[str], Any]) -> Callable[[str], Awaitable[Any]]:
+        """Async counterpart of wrap(); func may be sync or a coroutine function."""
+        async def coalesced(query: str) -> Any:
+            return await self.ado(cache_key(tool_name, query), functools.partial(func, query))
+
+        coalesced.__name__ = getattr(func, "__name__", tool_name)
+        return coalesced
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 1024, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of entries before the oldest is evicted
+            clock: Monotonic time source (overridable for tests)
+        """
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        """Return the cached value or MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store a value for ttl seconds."""
+        with self._lock:
+            self._entries[key] = (value, self._clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCacheStore:
+    """
+    On-disk cache tier backed by SQLite.
+
+    Survives restarts and is shared by every process using the same file.
+    Expiry uses wall-clock time; once the store holds more than max_entries
+    the entries closest to expiry are pruned.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tool_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tool_cache_expires ON tool_cache (expires_at);
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 100_000, clock: Callable[[], float] = time.time):
+        """
+        Open (and create if needed) the cache database.
+
+        Args:
+            db_path: Path to the SQLite database file
+            max_entries: Maximum number of stored entries
+            clock: Wall-clock time source (overridable for tests)
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._clock = clock
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(self._SCHEMA)
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        """Return the cached value or MISSING."""
+        row = self._connection().execute(
+            "SELECT value FROM tool_cache WHERE key = ? AND expires_at > ?",
+            (key, self._clock())
+        ).fetchone()
+        return row[0] if row else MISSING
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        """Store a string value for ttl seconds."""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tool_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, self._clock() + ttl)
+            )
+
+        # Pruning counts rows, so only do it every so often
+        with self._writes_lock:
+            self._writes += 1
+            prune = self._writes % 100 == 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """
+        Delete expired entries and enforce max_entries.
+
+        Returns:
+            Number of entries removed
+        """
+        conn = self._connection()
+        with conn:
+            removed = conn.execute(
+                "DELETE FROM tool_cache WHERE expires_at <= ?", (self._clock(),)
+            ).rowcount
+            excess = conn.execute("SELECT COUNT(*) FROM tool_cache").fetchone()[0] - self.max_entries
+            if excess > 0:
+                removed += conn.execute(
+                    "DELETE FROM tool_cache WHERE key IN "
+                    "(SELECT key FROM tool_cache ORDER BY expires_at LIMIT ?)",
+                    (excess,)
+                ).rowcount
+        return removed
+
+
+class ToolCache:
+    """
+    Two-tier cache for tool results: an in-memory LRU in front of an
+    optional on-disk store, with per-tool TTLs and hit/miss counters.
+    Misses go through a SingleFlight, so concurrent identical misses make
+    one upstream call.
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 3600,
+        max_entries: int = 1024,
+        disk: Optional[Any] = None,
+        flight: Optional[SingleFlight] = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            ttls: Seconds to keep results, by tool name
+            default_ttl: TTL for tools not listed in ttls
+            max_entries: Capacity of the in-memory tier
+            disk: Optional second tier with get(key)/set(key, value, ttl),
+                e.g. a SQLiteCacheStore
+            flight: Coalescer for upstream calls (a private one by default)
+        """
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.memory = LRUCache(max_entries=max_entries)
+        self.disk = disk
+        self.flight = flight or SingleFlight()
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._counters_lock = threading.Lock()
+
+    def _count(self, tool_name: str, counter: str) -> None:
+        with self._counters_lock:
+            counters = self._counters.setdefault(
+                tool_name, {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+            )
+            counters[counter] += 1
+
+    def ttl_for(self, tool_name: str) -> float:
+        """Return the TTL used for a tool's results."""
+        return self.ttls.get(tool_name, self.default_ttl)
+
+    @staticmethod
+    def make_key(tool_name: str, query: Any) -> str:
+        """Build the cache key for a tool query."""
+        return cache_key(tool_name, query)
+
+    def get(self, tool_name: str, query: Any) -> Any:
+        """
+        Look up a cached result, promoting disk hits into memory.
+
+        Returns:
+            The cached result or MISSING
+        """
+        key = self.make_key(tool_name, query)
+
+        value = self.memory.get(key)
+        if value is not MISSING:
+            self._count(tool_name, "memory_hits")
+            return value
+
+        return self._disk_get(tool_name, key)
+
+    def _disk_get(self, tool_name: str, key: str) -> Any:
+        """Second-tier lookup after a memory miss, counting the hit or miss."""
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not MISSING:
+                self._count(tool_name, "disk_hits")
+                self.memory.set(key, value, self.ttl_for(tool_name))
+                return value
+
+        self._count(tool_name, "misses")
+        return MISSING
+
+    def set(self, tool_name: str, query: Any, value: str) -> None:
+        """Store a result in both tiers."""
+        key = self.make_key(tool_name, query)
+        ttl = self.ttl_for(tool_name)
+        self.memory.set(key, value, ttl)
+        self._disk_set(key, value, ttl)
+
+    def _disk_set(self, key: str, value: str, ttl: float) -> None:
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, ttl)
+            except Exception as e:
+                logger.error("Error writing tool cache: %s", e)
+
+    def wrap(self, tool_name: str, func: Callable[[str], str]) -> Callable[[str], str]:
+        """
+        Wrap a single-input tool function with this cache.
+
+        Exceptions from func propagate and are not cached.
+
+        Args:
+            tool_name: Name used for TTL lookup and statistics
+            func: Function taking the query string
+
+        Returns:
+            Function with the same call signature
+        """
+        def cached(query: str) -> str:
+            value = self.get(tool_name, query)
+            if value is MISSING:
+                value = self.flight.do(
+                    self.make_key(tool_name, query),
+                    functools.partial(self._fetch, tool_name, func, query)
+                )
+            return value
+
+        cached.__name__ = getattr(func, "__name__", tool_name)
+        cached.__doc__ = getattr(func, "__doc__", None)
+        return cached
+
+    def awrap(self, tool_name: str, func: Callable[[str], Any]) -> Callable[[str], Awaitable[str]]:
+        """
+        Async counterpart of wrap().
+
+        A sync func runs in a worker thread and coalesces with sync callers;
+        a coroutine function is awaited directly. The disk tier is only
+        touched from worker threads, never on the event loop.
+        """
+        if asyncio.iscoroutinefunction(func):
+            async def fetch(query: str) -> str:
+                key = self.make_key(tool_name, query)
+                value = self.memory.get(key)
+                if value is MISSING:
+                    value = await func(query)
+                    ttl = self.ttl_for(tool_name)
+                    self.memory.set(key, value, ttl)
+                    if self.disk is not None:
+                        await asyncio.to_thread(self._disk_set, key, value, ttl)
+                return value
+        else:
+            fetch = functools.partial(self._fetch, tool_name, func)
+
+        async def cached(query: str) -> str:
+            key = self.make_key(tool_name, query)
+            value = self.memory.get(key)
+            if value is not MISSING:
+                self._count(tool_name, "memory_hits")
+                return value
+            if self.disk is not None:
+                value = await asyncio.to_thread(self._disk_get, tool_name, key)
+            else:
+                value = self._disk_get(tool_name, key)
+            if value is MISSING:
+                value = await self.flight.ado(key, functools.partial(fetch, query))
+            return value
+
+        cached.__name__ = getattr(func, "__name__", tool_name)
+        return cached
+
+    def _fetch(self, tool_name: str, func: Callable[[str], str], query: str) -> str:
+        """Call upstream and store the result, unless a racing call just stored it."""
+        value = self.memory.get(self.make_key(tool_name, query))
+        if value is MISSING:
+            value = func(query)
+            self.set(tool_name, query, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report hit/miss counters per tool and the in-memory size.
+
+        Returns:
+            Dictionary of cache statistics
+        """
+        with self._counters_lock:
+            tools = {name: dict(counters) for name, counters in self._counters.items()}
+
+        for counters in tools.values():
+            lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+            hits = lookups - counters["misses"]
+            counters["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+
+        return {
+            "entries": len(self.memory),
+            "max_entries": self.memory.max_entries,
+            "coalesced": self.flight.coalesced,
+            "tools": tools
+        }
@@ -1,8 +1,9 @@
 """
 Configuration settings for the LangChain chatbot.
 """
+import logging
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,17 +23,125 @@ class Settings:
     
     # Agent Settings
     MAX_ITERATIONS: int = int(os.getenv("MAX_ITERATIONS", "5"))
-    VERBOSE: bool = os.getenv("VERBOSE", "True").lower() == "true"
+    # Print LangChain's step-by-step chain output to stdout (debugging only;
+    # structured per-turn traces are recorded regardless)
+    VERBOSE: bool = os.getenv("VERBOSE", "False").lower() == "true"
+    
+    # Logging and Tracing
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    # Per-turn spans (LLM/tool calls, tokens, durations) kept per session
+    TRACE_ENABLED: bool = os.getenv("TRACE_ENABLED", "True").lower() == "true"
+    TRACE_BUFFER_SPANS: int = int(os.getenv("TRACE_BUFFER_SPANS", "256"))
+    # Optional JSONL file receiving a sample of traces
+    TRACE_SINK_PATH: Optional[str] = os.getenv("TRACE_SINK_PATH") or None
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+    
+    # Import the LLM client and tool libraries in the background when the API starts
+    WARM_UP_ON_STARTUP: bool = os.getenv("WARM_UP_ON_STARTUP", "True").lower() == "true"
+    
+    # Tool Dispatch
+    TOOL_DISPATCH: str = os.getenv("TOOL_DISPATCH", "concurrent")
+    TOOL_MAX_WORKERS: int = int(os.getenv("TOOL_MAX_WORKERS", "8"))
+    TOOL_TIMEOUT_SECONDS: float = float(os.getenv("TOOL_TIMEOUT_SECONDS", "30"))
+    # Per-tool overrides, e.g. "Wikipedia=10,WebSearch=15"
+    TOOL_TIMEOUTS: Dict[str, float] = {
+        name.strip(): float(seconds)
+        for name, seconds in (
+            item.split("=", 1) for item in os.getenv("TOOL_TIMEOUTS", "").split(",") if "=" in item
+        )
+    }
     
     # Chat History
     MAX_HISTORY_LENGTH: int = int(os.getenv("MAX_HISTORY_LENGTH", "10"))
+    MAX_HISTORY_TOKENS: int = int(os.getenv("MAX_HISTORY_TOKENS", "4000"))
+    # "heuristic", "chars" (len // 4) or "tiktoken" (requires tiktoken)
+    TOKEN_COUNTER: str = os.getenv("TOKEN_COUNTER", "heuristic")
+    # "window" drops old turns; "summary" folds them into a running summary
+    MEMORY_MODE: str = os.getenv("MEMORY_MODE", "window")
+    SUMMARY_MAX_WORDS: int = int(os.getenv("SUMMARY_MAX_WORDS", "200"))
+    SUMMARY_WORKERS: int = int(os.getenv("SUMMARY_WORKERS", "2"))
+    
+    # API Sessions
+    MAX_SESSIONS: int = int(os.getenv("MAX_SESSIONS", "1000"))
+    SESSION_TTL_SECONDS: float = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    SESSION_SWEEP_INTERVAL: float = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+    SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "memory")
+    SESSION_DB_PATH: str = os.getenv("SESSION_DB_PATH", "sessions.db")
+    SESSION_WRITE_BATCH_SIZE: int = int(os.getenv("SESSION_WRITE_BATCH_SIZE", "100"))
+    
+    # Admission Control (limits on concurrent /chat turns; 0 = unlimited)
+    ADMISSION_MAX_CONCURRENT: int = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))
+    ADMISSION_MAX_PER_SESSION: int = int(os.getenv("ADMISSION_MAX_PER_SESSION", "1"))
+    # Waiting requests beyond the limits; further requests get a 429
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+    ADMISSION_MAX_QUEUE_PER_SESSION: int = int(os.getenv("ADMISSION_MAX_QUEUE_PER_SESSION", "4"))
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "30"))
+    
+    # Batch Mode (python main.py --batch in.jsonl --out out.jsonl)
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    # Failed prompts are retried this many times, waiting backoff * 2**attempt
+    BATCH_RETRIES: int = int(os.getenv("BATCH_RETRIES", "2"))
+    BATCH_RETRY_BACKOFF_SECONDS: float = float(os.getenv("BATCH_RETRY_BACKOFF_SECONDS", "1"))
     
     # File Storage
     OUTPUT_DIR: str = os.getenv("OUTPUT_DIR", "outputs")
+    # Files saved by the SaveToFile tool are written in background batches
+    SAVE_BATCH_SIZE: int = int(os.getenv("SAVE_BATCH_SIZE", "64"))
+    SAVE_FSYNC: bool = os.getenv("SAVE_FSYNC", "True").lower() == "true"
     
     # Wikipedia Settings
     WIKI_TOP_K: int = int(os.getenv("WIKI_TOP_K", "2"))
     WIKI_MAX_CHARS: int = int(os.getenv("WIKI_MAX_CHARS", "1000"))
+    # "api" (live MediaWiki API) or "local" (offline FTS5 index built by local_wiki.py)
+    WIKI_BACKEND: str = os.getenv("WIKI_BACKEND", "api").lower()
+    LOCAL_WIKI_PATH: str = os.getenv("LOCAL_WIKI_PATH", "data/wikipedia.db")
+    
+    # Async HTTP Tools (Wikipedia/WebSearch on a shared aiohttp pool in async runs)
+    ASYNC_HTTP_TOOLS: bool = os.getenv("ASYNC_HTTP_TOOLS", "True").lower() == "true"
+    HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", "100"))
+    HTTP_POOL_SIZE_PER_HOST: int = int(os.getenv("HTTP_POOL_SIZE_PER_HOST", "0"))
+    HTTP_DNS_CACHE_TTL: int = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+    HTTP_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+    WIKIPEDIA_API_URL: str = os.getenv("WIKIPEDIA_API_URL", "https://en.wikipedia.org/w/api.php")
+    DUCKDUCKGO_HTML_URL: str = os.getenv("DUCKDUCKGO_HTML_URL", "https://html.duckduckgo.com/html/")
+    
+    # Tool Result Cache
+    TOOL_CACHE_ENABLED: bool = os.getenv("TOOL_CACHE_ENABLED", "True").lower() == "true"
+    TOOL_CACHE_MAX_ENTRIES: int = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+    TOOL_CACHE_PATH: Optional[str] = os.getenv("TOOL_CACHE_PATH") or None
+    TOOL_CACHE_TTL_WIKIPEDIA: float = float(os.getenv("TOOL_CACHE_TTL_WIKIPEDIA", "86400"))
+    TOOL_CACHE_TTL_WEBSEARCH: float = float(os.getenv("TOOL_CACHE_TTL_WEBSEARCH", "900"))
+    
+    # Context Cache (register the system prompt and tool schemas with the
+    # provider once; Gemini only caches prefixes above a minimum size)
+    CONTEXT_CACHE_ENABLED: bool = os.getenv("CONTEXT_CACHE_ENABLED", "False").lower() == "true"
+    CONTEXT_CACHE_TTL_SECONDS: int = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+    # Recreate the cache this long before it expires
+    CONTEXT_CACHE_REFRESH_SECONDS: int = int(os.getenv("CONTEXT_CACHE_REFRESH_SECONDS", "300"))
+    
+    # Fast Path (answer time/date questions and /commands without the agent)
+    FAST_PATH_ENABLED: bool = os.getenv("FAST_PATH_ENABLED", "True").lower() == "true"
+    
+    # Response Cache (answers to repeated context-free questions; requires numpy)
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "False").lower() == "true"
+    RESPONSE_CACHE_THRESHOLD: float = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.9"))
+    RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    # Answers that used any of these tools are never cached
+    RESPONSE_CACHE_BYPASS_TOOLS: List[str] = [
+        name.strip()
+        for name in os.getenv("RESPONSE_CACHE_BYPASS_TOOLS", "CurrentTime,WebSearch,SaveToFile").split(",")
+        if name.strip()
+    ]
+    
+    @classmethod
+    def configure_logging(cls):
+        """Send log records to stderr at LOG_LEVEL (no-op if logging is already set up)."""
+        logging.basicConfig(
+            level=cls.LOG_LEVEL,
+            format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+        )
     
     @classmethod
     def validate(cls):
@@ -0,0 +1,325 @@
+"""
+Provider-side caching of the agent's static prompt prefix.
+
+Every agent call sends the same system prompt and tool schemas. With a
+context cache the prefix is registered once with the provider (Gemini's
+cachedContents API), and calls reference it by name instead, so those
+tokens are neither re-sent nor billed at the full input rate.
+
+ContextCacheManager owns one cache handle per model: it creates the cache
+on first use, shares it across every session, recreates it shortly before
+it expires and falls back to sending the full prompt if the provider
+refuses (e.g. the prefix is below the provider's minimum cacheable size).
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import Runnable, RunnableLambda
+
+logger = logging.getLogger(__name__)
+
+
+class CachedContext(NamedTuple):
+    """A prefix registered with the provider."""
+    name: str
+    expires_at: float
+    token_count: int
+
+
+class ContextCacheProvider:
+    """Interface to a provider's context cache."""
+
+    def create(
+        self,
+        model: str,
+        system_prompt: str,
+        tools: Sequence[Any],
+        ttl_seconds: int
+    ) -> CachedContext:
+        """Register the prefix and return its handle."""
+        raise NotImplementedError
+
+    def delete(self, name: str) -> None:
+        """Delete a cache that is no longer used."""
+        raise NotImplementedError
+
+
+class GeminiContextCacheProvider(ContextCacheProvider):
+    """Context caches through the Gemini cachedContents API."""
+
+    def __init__(self, api_key: Optional[str] = None):
+        """
+        Args:
+            api_key: Google API key (defaults to GOOGLE_API_KEY)
+        """
+        self.api_key = api_key
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            import os
+            from google.ai import generativelanguage_v1beta as genai
+
+            self._client = genai.CacheServiceClient(
+                client_options={"api_key": self.api_key or os.getenv("GOOGLE_API_KEY")}
+            )
+        return self._client
+
+    def create(self, model, system_prompt, tools, ttl_seconds):
+        from datetime import timedelta
+        from google.ai import generativelanguage_v1beta as genai
+
+        model = model if model.startswith("models/") else f"models/{model}"
+        cached = self._get_client().create_cached_content(
+            cached_content=genai.CachedContent(
+                model=model,
+                display_name="langchain-ai-agent prompt",
+                system_instruction=genai.Content(parts=[genai.Part(text=system_prompt)]),
+                tools=[_function_declarations(genai, tools)],
+                ttl=timedelta(seconds=ttl_seconds)
+            )
+        )
+        return CachedContext(
+            name=cached.name,
+            expires_at=cached.expire_time.timestamp(),
+            token_count=cached.usage_metadata.total_token_count
+        )
+
+    def delete(self, name):
+        self._get_client().delete_cached_content(name=name)
+
+
+def _function_declarations(genai, tools: Sequence[Any]):
+    """
+    Build the genai Tool holding the tools' function declarations.
+
+    Uses langchain-google-genai's converter when its (private) module is
+    available, so schemas match what ChatGoogleGenerativeAI sends;
+    otherwise converts the public OpenAI-style tool schemas.
+    """
+    try:
+        from langchain_google_genai._function_utils import convert_to_genai_function_declarations
+    except ImportError:
+        pass
+    else:
+        return convert_to_genai_function_declarations(list(tools))
+
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+
+    def schema(spec: Dict[str, Any]):
+        kind = spec.get("type", "object")
+        if isinstance(kind, list):
+            kind = next((t for t in kind if t != "null"), "string")
+        return genai.Schema(
+            type_=genai.Type[kind.upper()],
+            description=spec.get("description", ""),
+            enum=[str(value) for value in spec.get("enum", [])],
+            properties={key: schema(value) for key, value in spec.get("properties", {}).items()},
+            required=spec.get("required", []),
+            items=schema(spec["items"]) if "items" in spec else None
+        )
+
+    declarations = []
+    for tool in tools:
+        function = convert_to_openai_tool(tool)["function"]
+        parameters = function.get("parameters") or {}
+        declarations.append(genai.FunctionDeclaration(
+            name=function["name"],
+            description=function.get("description", ""),
+            parameters=schema(parameters) if parameters.get("properties") else None
+        ))
+    return genai.Tool(function_declarations=declarations)
+
+
+class ContextCacheManager:
+    """
+    Keeps one live cache handle for a model's static prompt prefix.
+
+    handle() returns the current cache name, creating or refreshing the
+    cache when needed; concurrent callers wait for a single creation. After
+    a failed creation the uncached path is used until retry_seconds pass.
+    """
+
+    def __init__(
+        self,
+        provider: ContextCacheProvider,
+        model: str,
+        system_prompt: str,
+        tools: Sequence[Any],
+        ttl_seconds: int = 3600,
+        refresh_seconds: int = 300,
+        retry_seconds: float = 300,
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        Args:
+            provider: Provider cache API
+            model: Model the cache is created for
+            system_prompt: Static system prompt to cache
+            tools: Tools whose schemas are cached with the prompt
+            ttl_seconds: Lifetime requested for each cache
+            refresh_seconds: Recreate the cache this long before it expires
+            retry_seconds: Wait after a failed creation before trying again
+            clock: Wall-clock time source (overridable for tests)
+        """
+        self.provider = provider
+        self.model = model
+        self.system_prompt = system_prompt
+        self.tools = list(tools)
+        self.ttl_seconds = ttl_seconds
+        self.refresh_seconds = min(refresh_seconds, ttl_seconds // 2)
+        self.retry_seconds = retry_seconds
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._current: Optional[CachedContext] = None
+        # Replaced caches, left to expire so calls already sent with them succeed
+        self._retired: List[CachedContext] = []
+        self._retry_at = 0.0
+        self._stats = {
+            "created": 0,
+            "refreshed": 0,
+            "failed": 0,
+            "cached_calls": 0,
+            "uncached_calls": 0,
+            "cached_tokens": 0,
+            "input_tokens": 0,
+        }
+
+    def _fresh(self, now: float) -> bool:
+        return self._current is not None and self._current.expires_at - self.refresh_seconds > now
+
+    def handle(self) -> Optional[str]:
+        """Return the name of a live cache, or None to send the full prompt."""
+        now = self._clock()
+        current = self._current
+        if current is not None and current.expires_at - self.refresh_seconds > now:
+            return current.name
+
+        with self._lock:
+            now = self._clock()
+            if self._fresh(now):
+                return self._current.name
+            usable = self._current is not None and self._current.expires_at > now
+            if now < self._retry_at:
+                return self._current.name if usable else None
+
+            old = self._current
+            try:
+                self._current = self.provider.create(
+                    self.model, self.system_prompt, self.tools, self.ttl_seconds
+                )
+            except Exception as e:
+                self._stats["failed"] += 1
+                self._retry_at = now + self.retry_seconds
+                logger.error("Error creating context cache: %s", e)
+                return old.name if usable else None
+
+            self._stats["refreshed" if old is not None else "created"] += 1
+            self._retry_at = 0.0
+            # Requests already in flight may still reference the old cache,
+            # so it isn't deleted here; the provider drops it when its TTL ends
+            self._retired = [cached for cached in self._retired if cached.expires_at > now]
+            if old is not None and old.expires_at > now:
+                self._retired.append(old)
+            return self._current.name
+
+    async def ahandle(self) -> Optional[str]:
+        """Async handle(): creating a cache is a network call, so it runs in a thread."""
+        current = self._current
+        if current is not None and current.expires_at - self.refresh_seconds > self._clock():
+            return current.name
+        return await asyncio.to_thread(self.handle)
+
+    def record_usage(self, usage: Optional[Dict[str, Any]], cached: bool) -> None:
+        """Count an LLM call and the input tokens the provider read from the cache."""
+        usage = usage or {}
+        details = usage.get("input_token_details") or {}
+        with self._lock:
+            self._stats["cached_calls" if cached else "uncached_calls"] += 1
+            self._stats["input_tokens"] += usage.get("input_tokens", 0) or 0
+            self._stats["cached_tokens"] += details.get("cache_read", 0) or 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache lifecycle counts, call counts and cached input tokens."""
+        with self._lock:
+            stats = dict(self._stats)
+            current = self._current
+        stats["model"] = self.model
+        stats["active"] = current is not None and current.expires_at > self._clock()
+        stats["prefix_tokens"] = current.token_count if current else 0
+        stats["expires_in"] = round(max(0.0, current.expires_at - self._clock()), 1) if current else 0.0
+        return stats
+
+    def close(self) -> None:
+        """Delete the live cache and any replaced ones not yet expired (best effort)."""
+        with self._lock:
+            now = self._clock()
+            caches = [cached for cached in self._retired if cached.expires_at > now]
+            if self._current is not None:
+                caches.append(self._current)
+            self._current, self._retired = None, []
+        for cached in caches:
+            try:
+                self.provider.delete(cached.name)
+            except Exception as e:
+                logger.error("Error deleting context cache %s: %s", cached.name, e)
+
+
+def _cached_messages(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    Messages to send alongside a cache: the leading (cached) system prompt
+    is dropped, and any other system message (e.g. the conversation
+    summary) is sent as a user message, since a request that references a
+    cache can't carry its own system instruction.
+    """
+    if messages and isinstance(messages[0], SystemMessage):
+        messages = messages[1:]
+    return [
+        HumanMessage(content=message.content) if isinstance(message, SystemMessage) else message
+        for message in messages
+    ]
+
+
+def with_context_cache(llm: Any, tools: Sequence[Any], manager: ContextCacheManager) -> Runnable:
+    """
+    Wrap a chat model for use in the agent with a cached prompt prefix.
+
+    While a cache is live the model is called with cached_content and
+    without the system prompt and tool schemas; otherwise it gets the full
+    prompt with the tools bound, exactly as without caching.
+
+    Args:
+        llm: Chat model supporting the cached_content call option
+        tools: The agent's tools
+        manager: Manager owning the cache handle
+
+    Returns:
+        Runnable taking the agent's prompt value and returning the model message
+    """
+    with_tools = llm.bind_tools(tools)
+
+    def record(message: Any, cached: bool) -> Any:
+        manager.record_usage(getattr(message, "usage_metadata", None), cached)
+        return message
+
+    def select(name: Optional[str]) -> Runnable:
+        if name is None:
+            return with_tools | RunnableLambda(lambda message: record(message, False))
+        return (
+            RunnableLambda(lambda prompt: _cached_messages(prompt.to_messages()))
+            | llm.bind(cached_content=name)
+            | RunnableLambda(lambda message: record(message, True))
+        )
+
+    def route(prompt: Any) -> Runnable:
+        return select(manager.handle())
+
+    async def aroute(prompt: Any) -> Runnable:
+        return select(await manager.ahandle())
+
+    return RunnableLambda(route, afunc=aroute, name="ContextCachedModel")
@@ -0,0 +1,163 @@
+"""
+Agent executor that runs the tool calls of one LLM turn concurrently.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Union
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+from pydantic import Field, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingStep(NamedTuple):
+    """A tool call submitted to the pool whose observation isn't known yet."""
+    action: AgentAction
+    future: Future
+    submitted_at: float
+
+
+class ConcurrentAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor that dispatches all tool calls from a single LLM turn at once.
+
+    Tool-calling models may request several tools in one step. The stock
+    executor runs them one after another in sync mode; here they run on a
+    bounded thread pool (sync) or via asyncio.gather (async), so the step
+    takes as long as the slowest tool rather than the sum. Observations are
+    returned to the scratchpad in the order the model requested them. A
+    tool that exceeds its timeout yields an error observation instead of
+    stalling the run.
+
+    A timed-out async tool call is cancelled in the background; if the call
+    is shared with other sessions through the tool cache's single-flight,
+    only this run's wait is dropped. A thread can't be interrupted, so a
+    timed-out sync tool keeps its pool worker until it returns: the pool
+    size (max_tool_workers) bounds these orphaned threads, and while they
+    hold workers later calls queue (and may time out) instead of spawning
+    more threads. Calls that time out before a worker picks them up never
+    start.
+    """
+
+    max_tool_workers: int = 4
+    """Size of the thread pool shared by all runs of this executor."""
+
+    tool_timeout: Optional[float] = 30.0
+    """Default seconds a tool call may take (None = no limit)."""
+
+    tool_timeouts: Dict[str, float] = Field(default_factory=dict)
+    """Per-tool overrides of tool_timeout, by tool name."""
+
+    _pool: Optional[ThreadPoolExecutor] = PrivateAttr(default=None)
+    _pool_lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _orphaned: int = PrivateAttr(default=0)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=max(1, self.max_tool_workers),
+                    thread_name_prefix="agent-tool"
+                )
+            return self._pool
+
+    @property
+    def orphaned_tools(self) -> int:
+        """Timed-out sync tool calls still holding a pool worker."""
+        return self._orphaned
+
+    def _orphan(self, future: Future, tool_name: str) -> None:
+        """Stop waiting for a timed-out sync call, counting it until its thread finishes."""
+        if future.cancel():
+            return
+        with self._pool_lock:
+            self._orphaned += 1
+            orphaned = self._orphaned
+        logger.warning(
+            "Tool %s timed out; its thread keeps running (%d of %d workers held by timed-out calls)",
+            tool_name, orphaned, self.max_tool_workers
+        )
+        future.add_done_callback(self._release_orphan)
+
+    def _release_orphan(self, future: Future) -> None:
+        with self._pool_lock:
+            self._orphaned -= 1
+
+    def timeout_for(self, tool_name: str) -> Optional[float]:
+        """Return the timeout applied to a tool."""
+        return self.tool_timeouts.get(tool_name, self.tool_timeout)
+
+    @staticmethod
+    def _timeout_step(action: AgentAction, timeout: float) -> AgentStep:
+        return AgentStep(
+            action=action,
+            observation=f"Error: {action.tool} timed out after {timeout:g} seconds."
+        )
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        # Submit instead of running inline; _iter_next_step collects the results
+        context = contextvars.copy_context()
+        future = self._get_pool().submit(
+            context.run,
+            super()._perform_agent_action,
+            name_to_tool_map,
+            color_mapping,
+            agent_action,
+            run_manager,
+        )
+        return _PendingStep(agent_action, future, time.monotonic())
+
+    def _iter_next_step(
+        self,
+        name_to_tool_map,
+        color_mapping,
+        inputs,
+        intermediate_steps,
+        run_manager=None,
+    ) -> Iterator[Union[AgentFinish, AgentAction, AgentStep]]:
+        pending: List[_PendingStep] = []
+
+        # The base generator yields every action, then "performs" each one;
+        # our _perform_agent_action only submits, so all tools start together.
+        for item in super()._iter_next_step(
+            name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+        ):
+            if isinstance(item, _PendingStep):
+                pending.append(item)
+            else:
+                yield item
+
+        for step in pending:
+            timeout = self.timeout_for(step.action.tool)
+            remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - step.submitted_at))
+            try:
+                yield step.future.result(timeout=remaining)
+            except FutureTimeoutError:
+                self._orphan(step.future, step.action.tool)
+                yield self._timeout_step(step.action, timeout)
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        # The base class already gathers these concurrently; add the timeout
+        timeout = self.timeout_for(agent_action.tool)
+        task = asyncio.ensure_future(
+            super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        )
+        try:
+            # Shielded so the timeout returns right away rather than waiting
+            # for the tool to unwind
+            return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except asyncio.TimeoutError:
+            # Cancelling the task drops only this run's wait on a coalesced
+            # call; the shared call continues while other sessions await it
+            task.cancel()
+            return self._timeout_step(agent_action, timeout)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
@@ -0,0 +1,206 @@
+"""
+Deterministic fake chat model and tools for offline tests and benchmarks.
+"""
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Union
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import Tool
+from pydantic import Field, PrivateAttr
+
+from context_cache import CachedContext, ContextCacheProvider
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that replays a fixed list of responses.
+
+    Responses are cycled in order. A plain string becomes an ``AIMessage``;
+    an ``AIMessage`` with ``tool_calls`` makes the agent invoke a tool.
+    ``latency`` simulates the provider round trip (``time.sleep`` for sync
+    calls, ``asyncio.sleep`` for async ones). When streamed, text responses
+    are emitted word by word with the latency spread across the chunks.
+
+    Each call is logged in ``requests`` (whether it referenced a context
+    cache and carried a system prompt), and responses report token usage:
+    roughly a token per four characters of input, plus
+    ``cached_prefix_tokens`` read from the cache when called with
+    ``cached_content``.
+    """
+
+    responses: List[Union[str, AIMessage]] = Field(default_factory=lambda: ["Hello from the fake model."])
+    latency: float = 0.0
+    temperature: float = 0.7
+    cached_prefix_tokens: int = 0
+    _counter: Any = PrivateAttr(default_factory=itertools.count)
+    _requests: List[Dict[str, Any]] = PrivateAttr(default_factory=list)
+
+    @property
+    def requests(self) -> List[Dict[str, Any]]:
+        """One entry per model call, oldest first."""
+        return self._requests
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeChatModel":
+        """Tool binding is a no-op; tool calls come from the scripted responses."""
+        return self
+
+    def _next_message(self, messages: List[BaseMessage], **kwargs: Any) -> AIMessage:
+        response = self.responses[next(self._counter) % len(self.responses)]
+        message = response.model_copy() if isinstance(response, AIMessage) else AIMessage(content=response)
+
+        cached_content = kwargs.get("cached_content")
+        self._requests.append({
+            "cached_content": cached_content,
+            "system": any(isinstance(m, SystemMessage) for m in messages),
+        })
+        cache_read = self.cached_prefix_tokens if cached_content else 0
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4 + cache_read
+        output_tokens = len(str(message.content)) // 4
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cache_read},
+        }
+        return message
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages, **kwargs))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages, **kwargs))])
+
+    @staticmethod
+    def _to_chunks(message: AIMessage) -> List[AIMessageChunk]:
+        if message.tool_calls:
+            return [AIMessageChunk(
+                content=message.content,
+                tool_call_chunks=[
+                    {"name": tc["name"], "args": json.dumps(tc["args"]), "id": tc["id"], "index": i}
+                    for i, tc in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata,
+            )]
+        words = str(message.content).split(" ")
+        # Usage is reported once, on the last chunk
+        return [
+            AIMessageChunk(
+                content=word if i == 0 else " " + word,
+                usage_metadata=message.usage_metadata if i == len(words) - 1 else None
+            )
+            for i, word in enumerate(words)
+        ]
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        chunks = self._to_chunks(self._next_message(messages, **kwargs))
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            if run_manager:
+                run_manager.on_llm_new_token(str(chunk.content), chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        chunks = self._to_chunks(self._next_message(messages, **kwargs))
+        for chunk in chunks:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(chunks))
+            if run_manager:
+                await run_manager.on_llm_new_token(str(chunk.content), chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+
+def make_fake_tool(name: str, latency: float = 0.0) -> Tool:
+    """
+    Create a tool that echoes its input after a fixed delay.
+
+    Args:
+        name: Tool name the scripted model can call
+        latency: Simulated seconds per call (sync and async)
+
+    Returns:
+        A Tool returning "<name>: <query>"
+    """
+    def run(query: str) -> str:
+        if latency:
+            time.sleep(latency)
+        return f"{name}: {query}"
+
+    async def arun(query: str) -> str:
+        if latency:
+            await asyncio.sleep(latency)
+        return f"{name}: {query}"
+
+    return Tool(name=name, func=run, coroutine=arun, description=f"Fake {name} tool.")
+
+
+class FakeContextCacheProvider(ContextCacheProvider):
+    """
+    In-memory context cache provider.
+
+    Caches get sequential names and a token count of about one per four
+    characters of prompt and tool descriptions. Set ``fail`` to make
+    creation raise.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.fail = False
+        self.created: List[CachedContext] = []
+        self.deleted: List[str] = []
+
+    def create(self, model: str, system_prompt: str, tools: Sequence[Any], ttl_seconds: int) -> CachedContext:
+        if self.fail:
+            raise RuntimeError("cache creation failed")
+        size = len(system_prompt) + sum(len(tool.name) + len(tool.description) for tool in tools)
+        cached = CachedContext(
+            name=f"cachedContents/fake-{len(self.created) + 1}",
+            expires_at=self.clock() + ttl_seconds,
+            token_count=size // 4
+        )
+        self.created.append(cached)
+        return cached
+
+    def delete(self, name: str) -> None:
+        self.deleted.append(name)
@@ -0,0 +1,208 @@
+"""
+Background writer for files saved by tools.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundFileWriter:
+    """
+    Write-behind queue for small text files.
+
+    submit() picks a collision-free path and returns it at once; a
+    background thread creates directories, writes queued files in batches
+    and fsyncs each batch together (files, then each directory once), so
+    saving never blocks the caller on disk I/O.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 64,
+        flush_interval: float = 0.05,
+        fsync: bool = True,
+        clock: Callable[[], datetime] = datetime.now
+    ):
+        """
+        Start the writer thread.
+
+        Args:
+            batch_size: Maximum files written per batch
+            flush_interval: Seconds the writer waits to fill a batch
+            fsync: Whether to fsync files and directories after each batch
+            clock: Source of the timestamp used in file names
+        """
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._clock = clock
+
+        self._queue: "queue.Queue" = queue.Queue()
+        # Paths handed out but not written yet, so names stay unique
+        self._reserved: Set[str] = set()
+        # Next counter per name within the current second, so repeated names
+        # don't rescan taken paths
+        self._counters: Dict[str, int] = {}
+        self._counter_timestamp = ""
+        self._lock = threading.Lock()
+        self._stats = {"written": 0, "failed": 0, "batches": 0}
+        self._closed = False
+
+        self._writer = threading.Thread(target=self._write_loop, name="file-writer", daemon=True)
+        self._writer.start()
+
+    def reserve_path(self, directory: str, filename: str) -> str:
+        """
+        Return an unused path "<directory>/<timestamp>_<filename>".
+
+        If that name is taken (by an earlier save in the same second or an
+        existing file), a counter is added before the extension.
+
+        Args:
+            directory: Target directory
+            filename: Requested file name
+
+        Returns:
+            The reserved path
+        """
+        timestamp = self._clock().strftime("%Y%m%d_%H%M%S")
+        stem, ext = os.path.splitext(os.path.basename(filename) or "output.txt")
+        base = os.path.join(directory, f"{timestamp}_{stem}")
+        with self._lock:
+            if timestamp != self._counter_timestamp:
+                self._counters.clear()
+                self._counter_timestamp = timestamp
+            n = self._counters.get(base, 0)
+            while True:
+                path = f"{base}{ext}" if n == 0 else f"{base}_{n}{ext}"
+                n += 1
+                if path not in self._reserved and not os.path.exists(path):
+                    self._counters[base] = n
+                    self._reserved.add(path)
+                    return path
+
+    def submit(self, directory: str, filename: str, data: str) -> str:
+        """
+        Queue a file to be written.
+
+        Args:
+            directory: Target directory (created if needed)
+            filename: Requested file name (timestamp-prefixed and de-duplicated)
+            data: Text content
+
+        Returns:
+            The path the file will be written to
+        """
+        if self._closed:
+            raise RuntimeError("File writer is closed")
+        path = self.reserve_path(directory, filename)
+        self._queue.put(("write", path, data))
+        return path
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every file submitted so far is written."""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Write everything still queued and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        done = threading.Event()
+        self._queue.put(("stop", done))
+        done.wait()
+        self._writer.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Files written and failed, batches, and files still queued."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._reserved)
+        return stats
+
+    def _write_loop(self) -> None:
+        while True:
+            op = self._queue.get()
+            batch = [op]
+            deadline = time.monotonic() + self.flush_interval
+            # Fill the batch until it's full, the interval passes or a flush is requested
+            while len(batch) < self.batch_size and batch[-1][0] == "write":
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            writes = [(op[1], op[2]) for op in batch if op[0] == "write"]
+            if writes:
+                self._write_batch(writes)
+
+            for op in batch:
+                if op[0] in ("flush", "stop"):
+                    op[1].set()
+            if batch[-1][0] == "stop":
+                return
+
+    def _write_batch(self, writes: List[Tuple[str, str]]) -> None:
+        opened = []
+        failed = 0
+        for path, data in writes:
+            f = None
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                # "x": never overwrite a file that appeared since the name was reserved
+                f = open(path, "x", encoding="utf-8")
+                f.write(data)
+                f.flush()
+                opened.append((path, f))
+            except Exception as e:
+                if f is not None:
+                    f.close()
+                failed += 1
+                logger.error("Error saving file %s: %s", path, e)
+
+        for path, f in opened:
+            try:
+                if self.fsync:
+                    os.fsync(f.fileno())
+            except OSError as e:
+                logger.error("Error syncing file %s: %s", path, e)
+            finally:
+                f.close()
+
+        if self.fsync:
+            for directory in {os.path.dirname(path) or "." for path, _ in opened}:
+                self._fsync_dir(directory)
+
+        with self._lock:
+            for path, _ in writes:
+                self._reserved.discard(path)
+            self._stats["written"] += len(opened)
+            self._stats["failed"] += failed
+            self._stats["batches"] += 1
+
+    @staticmethod
+    def _fsync_dir(directory: str) -> None:
+        """Persist new directory entries (not supported on Windows)."""
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
@@ -0,0 +1,199 @@
+"""
+Async Wikipedia and web search clients on a shared aiohttp connection pool.
+
+These back the coroutine side of the Wikipedia and WebSearch tools, so an
+async agent run makes its HTTP calls on the event loop instead of in worker
+threads, and every call reuses keep-alive connections from one pool.
+aiohttp is imported on first use.
+"""
+import asyncio
+import html
+import re
+from typing import Any, Dict, List, Optional
+
+# Same fallbacks as the synchronous langchain_community wrappers
+NO_WIKIPEDIA_RESULT = "No good Wikipedia Search Result was found"
+NO_SEARCH_RESULT = "No good DuckDuckGo Search Result was found"
+
+# Wikipedia rejects longer search queries
+WIKIPEDIA_MAX_QUERY_LENGTH = 300
+
+_SNIPPET = re.compile(r'<a[^>]*class="result__snippet"[^>]*>(.*?)</a>', re.DOTALL)
+_TAG = re.compile(r"<[^>]+>")
+
+
+class AsyncHTTPClient:
+    """
+    Lazily created aiohttp session with a bounded keep-alive connection pool.
+
+    One session (and connector) is kept per event loop; it is recreated if
+    the loop it was made on has gone away, e.g. between test cases.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 100,
+        pool_size_per_host: int = 0,
+        dns_cache_ttl: Optional[int] = 300,
+        timeout: float = 10.0,
+        connect_timeout: Optional[float] = 5.0,
+        user_agent: str = "langchain-ai-agent/1.0"
+    ):
+        """
+        Initialize the client (no connections are opened yet).
+
+        Args:
+            pool_size: Maximum open connections in total
+            pool_size_per_host: Maximum open connections per host (0 = no limit)
+            dns_cache_ttl: Seconds to cache DNS lookups (None = forever)
+            timeout: Total seconds allowed per request
+            connect_timeout: Seconds allowed to establish a connection
+            user_agent: User-Agent header sent with every request
+        """
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.user_agent = user_agent
+        self._session = None
+        self._loop = None
+
+    def session(self) -> Any:
+        """Return the aiohttp.ClientSession for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            import aiohttp
+
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout),
+                headers={"User-Agent": self.user_agent}
+            )
+            self._loop = loop
+        return self._session
+
+    async def get_json(self, url: str, params: Dict[str, Any]) -> Any:
+        """GET a URL and decode the JSON body (raises on HTTP errors)."""
+        async with self.session().get(url, params=params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def post_text(self, url: str, data: Dict[str, Any]) -> str:
+        """POST a form and return the body as text (raises on HTTP errors)."""
+        async with self.session().post(url, data=data) as response:
+            response.raise_for_status()
+            return await response.text()
+
+    async def close(self):
+        """Close the session and its pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+
+class AsyncWikipedia:
+    """Wikipedia search through the MediaWiki API, formatted like WikipediaQueryRun."""
+
+    def __init__(
+        self,
+        client: AsyncHTTPClient,
+        api_url: str = "https://en.wikipedia.org/w/api.php",
+        top_k_results: int = 2,
+        max_chars: int = 1000
+    ):
+        """
+        Args:
+            client: Shared HTTP client
+            api_url: MediaWiki api.php endpoint
+            top_k_results: Pages to summarize per query
+            max_chars: Maximum length of the combined result
+        """
+        self.client = client
+        self.api_url = api_url
+        self.top_k_results = top_k_results
+        self.max_chars = max_chars
+
+    async def run(self, query: str) -> str:
+        """Search Wikipedia and return the intro of the top pages."""
+        found = await self.client.get_json(self.api_url, {
+            "action": "query",
+            "list": "search",
+            "srsearch": query[:WIKIPEDIA_MAX_QUERY_LENGTH],
+            "srlimit": self.top_k_results,
+            "format": "json",
+        })
+        titles = [hit["title"] for hit in found.get("query", {}).get("search", [])][:self.top_k_results]
+        if not titles:
+            return NO_WIKIPEDIA_RESULT
+
+        # One request for all page intros
+        extracts = await self.client.get_json(self.api_url, {
+            "action": "query",
+            "prop": "extracts",
+            "exintro": 1,
+            "explaintext": 1,
+            "redirects": 1,
+            "titles": "|".join(titles),
+            "format": "json",
+        })
+        pages = {
+            page.get("title"): page.get("extract")
+            for page in extracts.get("query", {}).get("pages", {}).values()
+        }
+        redirects = {
+            item["from"]: item["to"]
+            for item in extracts.get("query", {}).get("redirects", [])
+        }
+
+        summaries = []
+        for title in titles:
+            extract = pages.get(redirects.get(title, title))
+            if extract:
+                summaries.append(f"Page: {title}\nSummary: {extract}")
+        if not summaries:
+            return NO_WIKIPEDIA_RESULT
+        return "\n\n".join(summaries)[:self.max_chars]
+
+
+class AsyncWebSearch:
+    """DuckDuckGo search through its HTML endpoint, formatted like DuckDuckGoSearchRun."""
+
+    def __init__(
+        self,
+        client: AsyncHTTPClient,
+        url: str = "https://html.duckduckgo.com/html/",
+        max_results: int = 5
+    ):
+        """
+        Args:
+            client: Shared HTTP client
+            url: DuckDuckGo HTML search endpoint
+            max_results: Result snippets to include
+        """
+        self.client = client
+        self.url = url
+        self.max_results = max_results
+
+    @staticmethod
+    def parse_snippets(page: str) -> List[str]:
+        """Extract the plain-text result snippets from a results page."""
+        return [
+            " ".join(html.unescape(_TAG.sub("", snippet)).split())
+            for snippet in _SNIPPET.findall(page)
+        ]
+
+    async def run(self, query: str) -> str:
+        """Search the web and return the top result snippets."""
+        page = await self.client.post_text(self.url, {"q": query})
+        snippets = [s for s in self.parse_snippets(page) if s][:self.max_results]
+        if not snippets:
+            return NO_SEARCH_RESULT
+        return " ".join(snippets)
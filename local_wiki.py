@@ -0,0 +1,383 @@
+"""
+Offline Wikipedia backend: a SQLite FTS5 index over a local article dump.
+
+Build the index once from a MediaWiki XML dump (.xml or .xml.bz2) or a
+JSONL corpus with "title" and "text" fields (.jsonl, .jsonl.gz or
+.jsonl.bz2, e.g. WikiExtractor output):
+
+    python local_wiki.py enwiki-latest-pages-articles.xml.bz2 --db data/wikipedia.db
+
+The dump is streamed, so ingestion runs in constant memory. Queries are
+ranked with BM25 (titles weigh more than body text) and formatted like
+WikipediaQueryRun, so the Wikipedia tool can switch to it with
+WIKI_BACKEND=local.
+"""
+import argparse
+import bz2
+import gzip
+import html
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+from http_tools import NO_WIKIPEDIA_RESULT
+
+logger = logging.getLogger(__name__)
+
+# Query terms beyond this are ignored
+MAX_QUERY_TERMS = 32
+
+# BM25 column weights: (title, text)
+TITLE_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+
+_WORD = re.compile(r"\w+")
+
+# Wikitext markup, removed in this order by strip_wikitext
+_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+_REF = re.compile(r"<ref[^>/]*/>|<ref[^>]*>.*?</ref>", re.DOTALL | re.IGNORECASE)
+_TEMPLATE = re.compile(r"\{\{[^{}]*\}\}")
+_TABLE = re.compile(r"\{\|.*?\|\}", re.DOTALL)
+_FILE_LINK = re.compile(r"\[\[(?:File|Image|Category):[^\[\]]*\]\]", re.IGNORECASE)
+_LINK = re.compile(r"\[\[(?:[^\[\]|]*\|)?([^\[\]|]*)\]\]")
+_EXTERNAL_LINK = re.compile(r"\[https?://[^\s\]]+ ?([^\]]*)\]")
+_EMPHASIS = re.compile(r"'{2,}")
+_HEADING = re.compile(r"^=+\s*(.*?)\s*=+\s*$", re.MULTILINE)
+_TAG = re.compile(r"<[^>]+>")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def strip_wikitext(text: str) -> str:
+    """
+    Convert wikitext to plain text (roughly; enough for search and snippets).
+
+    Args:
+        text: Raw article wikitext
+
+    Returns:
+        Plain text without templates, references, tables or link markup
+    """
+    text = _COMMENT.sub("", text)
+    text = _REF.sub("", text)
+    # Templates and links nest; strip the innermost level until none are left
+    for _ in range(10):
+        stripped = _TEMPLATE.sub("", text)
+        if stripped == text:
+            break
+        text = stripped
+    text = _TABLE.sub("", text)
+    for _ in range(10):
+        stripped = _LINK.sub(r"\1", _FILE_LINK.sub("", text))
+        if stripped == text:
+            break
+        text = stripped
+    text = _EXTERNAL_LINK.sub(r"\1", text)
+    text = _EMPHASIS.sub("", text)
+    text = _HEADING.sub(r"\1", text)
+    text = html.unescape(_TAG.sub("", text))
+    lines = (line.strip() for line in text.splitlines())
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _open_dump(path: str, mode: str = "rb") -> IO:
+    if path.endswith(".bz2"):
+        return bz2.open(path, mode)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def _iter_xml(path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (title, wikitext) for main-namespace, non-redirect pages of a MediaWiki dump."""
+    with _open_dump(path) as f:
+        title, namespace, text, redirect = None, "0", None, False
+        root = None
+        for event, element in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+            tag = element.tag.rsplit("}", 1)[-1]
+            if tag == "title":
+                title = element.text
+            elif tag == "ns":
+                namespace = element.text
+            elif tag == "redirect":
+                redirect = True
+            elif tag == "text":
+                text = element.text
+            elif tag == "page":
+                if title and text and namespace == "0" and not redirect:
+                    yield title, text
+                title, namespace, text, redirect = None, "0", None, False
+                # Drop the parsed page, and the root's reference to it, so
+                # memory stays flat over the whole dump
+                root.clear()
+
+
+def _iter_jsonl(path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (title, text) from a JSONL corpus, skipping malformed lines."""
+    with _open_dump(path, "rt") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and record.get("title") and record.get("text"):
+                yield record["title"], record["text"]
+
+
+def iter_dump(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Stream (title, plain text) articles from a dump file.
+
+    Args:
+        path: MediaWiki XML dump or JSONL corpus, optionally .bz2/.gz compressed
+
+    Yields:
+        (title, text) pairs
+    """
+    name = path.rsplit(".", 1)[0] if path.endswith((".bz2", ".gz")) else path
+    if name.endswith(".xml"):
+        for title, text in _iter_xml(path):
+            text = strip_wikitext(text)
+            if text:
+                yield title, text
+    else:
+        yield from _iter_jsonl(path)
+
+
+def extract_snippet(text: str, terms: List[str], max_chars: int) -> str:
+    """
+    Cut a passage of at most max_chars from an article.
+
+    The lead of the article is used (like the API's page summary) unless
+    the first query term match lies beyond it, in which case the passage
+    starts at the sentence containing that match.
+
+    Args:
+        text: Article text
+        terms: Lower-cased query terms
+        max_chars: Maximum passage length
+
+    Returns:
+        The passage, with "..." marking cuts
+    """
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 3:
+        return text[:max_chars]
+
+    start = 0
+    if terms:
+        pattern = r"\b(?:" + "|".join(re.escape(term) for term in terms) + r")"
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match and match.end() > max_chars - 3:
+            floor = max(0, match.start() - max_chars // 4)
+            boundary = text.rfind(". ", floor, match.start())
+            start = boundary + 2 if boundary != -1 else floor
+
+    prefix = "..." if start else ""
+    budget = max_chars - len(prefix)
+    if len(text) - start <= budget:
+        return prefix + text[start:]
+    budget -= 3
+    end = text.rfind(" ", start, start + budget + 1)
+    if end <= start:
+        end = start + budget
+    return prefix + text[start:end].rstrip() + "..."
+
+
+class LocalWikipedia:
+    """
+    Article search over a SQLite FTS5 index, formatted like WikipediaQueryRun.
+
+    Pages live in a regular table keyed by title; an external-content FTS5
+    table indexes their title and text. Each thread gets its own connection.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pages (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL UNIQUE,
+            text TEXT NOT NULL
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+            title, text, content='pages', content_rowid='id', tokenize='porter unicode61'
+        );
+    """
+
+    def __init__(self, db_path: str, top_k_results: int = 2, max_chars: int = 1000):
+        """
+        Open (and create if needed) the index.
+
+        Args:
+            db_path: Path to the SQLite database file
+            top_k_results: Pages to summarize per query
+            max_chars: Maximum length of the combined result
+        """
+        self.db_path = db_path
+        self.top_k_results = top_k_results
+        self.max_chars = max_chars
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(self._SCHEMA)
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add_articles(
+        self,
+        articles: Iterable[Tuple[str, str]],
+        batch_size: int = 1000,
+        progress=None
+    ) -> int:
+        """
+        Index articles, replacing any existing page with the same title.
+
+        Args:
+            articles: (title, text) pairs; consumed lazily
+            batch_size: Articles committed per transaction
+            progress: Optional callback called with the running count after each batch
+
+        Returns:
+            Number of articles indexed
+        """
+        conn = self._connection()
+        count = 0
+        batch: List[Tuple[str, str]] = []
+
+        def write(rows: List[Tuple[str, str]]):
+            with conn:
+                for title, text in rows:
+                    old = conn.execute("SELECT id, text FROM pages WHERE title = ?", (title,)).fetchone()
+                    if old is not None:
+                        # External-content tables need the old values to unindex a row
+                        conn.execute(
+                            "INSERT INTO pages_fts (pages_fts, rowid, title, text) VALUES ('delete', ?, ?, ?)",
+                            (old[0], title, old[1])
+                        )
+                        conn.execute("UPDATE pages SET text = ? WHERE id = ?", (text, old[0]))
+                        rowid = old[0]
+                    else:
+                        rowid = conn.execute(
+                            "INSERT INTO pages (title, text) VALUES (?, ?)", (title, text)
+                        ).lastrowid
+                    conn.execute(
+                        "INSERT INTO pages_fts (rowid, title, text) VALUES (?, ?, ?)", (rowid, title, text)
+                    )
+
+        for article in articles:
+            batch.append(article)
+            if len(batch) >= batch_size:
+                write(batch)
+                count += len(batch)
+                batch = []
+                if progress is not None:
+                    progress(count)
+        if batch:
+            write(batch)
+            count += len(batch)
+            if progress is not None:
+                progress(count)
+        return count
+
+    def optimize(self) -> None:
+        """Merge the index's segments (run once after a large ingestion)."""
+        conn = self._connection()
+        with conn:
+            conn.execute("INSERT INTO pages_fts (pages_fts) VALUES ('optimize')")
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        Return the best matching (title, text) pages, best first.
+
+        Args:
+            query: Free-text query; any word may match
+            limit: Maximum pages (default: top_k_results)
+
+        Returns:
+            Matching pages ranked by BM25
+        """
+        terms = _WORD.findall(query.lower())[:MAX_QUERY_TERMS]
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        return self._connection().execute(
+            "SELECT pages.title, pages.text FROM pages_fts "
+            "JOIN pages ON pages.id = pages_fts.rowid "
+            "WHERE pages_fts MATCH ? "
+            f"ORDER BY bm25(pages_fts, {TITLE_WEIGHT}, {TEXT_WEIGHT}) LIMIT ?",
+            (match, limit or self.top_k_results)
+        ).fetchall()
+
+    def run(self, query: str) -> str:
+        """Search the index and return a passage of the top pages."""
+        try:
+            pages = self.search(query)
+        except sqlite3.Error as e:
+            logger.error("Error searching local Wikipedia: %s", e)
+            return NO_WIKIPEDIA_RESULT
+        if not pages:
+            return NO_WIKIPEDIA_RESULT
+
+        terms = _WORD.findall(query.lower())[:MAX_QUERY_TERMS]
+        # Split the character budget between the pages, net of their headers
+        share = self.max_chars // len(pages)
+        summaries = []
+        for title, text in pages:
+            header = f"Page: {title}\nSummary: "
+            snippet = extract_snippet(text, terms, max(0, share - len(header) - 2))
+            summaries.append(header + snippet)
+        return "\n\n".join(summaries)[:self.max_chars]
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Ingest a dump into the local index."""
+    from config import settings
+
+    parser = argparse.ArgumentParser(description="Build the offline Wikipedia index")
+    parser.add_argument("dump", help="MediaWiki XML dump or JSONL corpus (.bz2/.gz ok)")
+    parser.add_argument("--db", default=settings.LOCAL_WIKI_PATH, help="SQLite index to create or update")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Articles per transaction")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.dump):
+        print(f"Error: dump not found: {args.dump}")
+        return 1
+
+    index = LocalWikipedia(args.db)
+    start = time.perf_counter()
+
+    def report(count: int):
+        if count % (args.batch_size * 10) == 0:
+            print(f"{count} articles ({count / (time.perf_counter() - start):.0f}/s)")
+
+    count = index.add_articles(iter_dump(args.dump), batch_size=args.batch_size, progress=report)
+    index.optimize()
+    print(f"Indexed {count} articles into {args.db} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,52 @@
 from dotenv import load_dotenv
+import argparse
+import asyncio
+import logging
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
+import threading
+from contextlib import nullcontext
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnablePassthrough
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from concurrent.futures import ThreadPoolExecutor
 from tools import all_tools
+from sessions import HistoryBackend
+from memory import ConversationSummarizer, HistoryWindow, get_token_counter
+from config import settings
+from metrics import TurnMetrics, fast_path_hits, response_cache_hits
+from tracing import TraceRecorder, trace_store
+from router import FastPathRouter, build_default_router
+from context_cache import ContextCacheManager, GeminiContextCacheProvider, with_context_cache
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+    from response_cache import ResponseCache
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+# Static agent instructions; with context caching this and the tool schemas
+# are registered with the provider once instead of being sent every call
+SYSTEM_PROMPT = """You are a helpful AI assistant with access to various tools.
+
+Your capabilities include:
+- Searching Wikipedia for detailed information
+- Searching the web for current information
+- Saving content to files
+- Getting the current date and time
+
+Always be helpful, accurate, and cite your sources when using tools.
+When saving information, provide a clear summary of what was saved.
+If you're unsure about something, say so rather than making up information.
+"""
+
 
 class ResearchResponse(BaseModel):
     """Structured response for research queries."""
@@ -24,57 +59,398 @@ class ResearchResponse(BaseModel):
 class ChatBot:
     """LangChain-powered chatbot with tool integration and memory."""
     
-    def __init__(self, model_name: str = "gemini-2.0-flash-exp", temperature: float = 0.7):
+    # LLM clients and compiled agents shared by every bot with the same
+    # (model_name, temperature). AgentExecutor keeps no per-run state, so one
+    # instance can serve any number of sessions concurrently.
+    _shared_agents: Dict[Tuple[str, float], Tuple[BaseChatModel, "AgentExecutor"]] = {}
+    _shared_agents_lock = threading.Lock()
+    
+    # Worker threads that fold evicted turns into summaries ("summary" memory mode)
+    _summary_pool: Optional[ThreadPoolExecutor] = None
+    _summary_pool_lock = threading.Lock()
+    
+    # Response cache shared by every bot (settings.RESPONSE_CACHE_ENABLED)
+    _response_cache = None
+    _response_cache_lock = threading.Lock()
+    
+    # Provider context caches for the static prompt, one per model
+    # (settings.CONTEXT_CACHE_ENABLED)
+    _context_caches: Dict[str, ContextCacheManager] = {}
+    _context_caches_lock = threading.Lock()
+    
+    # Fast-path router shared by every bot (settings.FAST_PATH_ENABLED)
+    _router: Optional[FastPathRouter] = None
+    _router_lock = threading.Lock()
+    
+    def __init__(
+        self,
+        model_name: str = "gemini-2.0-flash-exp",
+        temperature: float = 0.7,
+        llm: Optional[BaseChatModel] = None,
+        history_backend: Optional[HistoryBackend] = None,
+        session_id: Optional[str] = None,
+        memory_mode: Optional[str] = None,
+        summarizer: Optional[ConversationSummarizer] = None,
+        response_cache: Optional["ResponseCache"] = None,
+        router: Optional[FastPathRouter] = None,
+        context_cache: Optional[ContextCacheManager] = None
+    ):
         """
         Initialize the chatbot.
         
+        Per-bot state is only the chat history; the LLM client and agent are
+        shared across bots with the same configuration.
+        
         Args:
             model_name: The LLM model to use
             temperature: Temperature setting for response generation (0.0-1.0)
+            llm: Optional pre-built chat model (overrides model_name/temperature
+                and gets its own agent instead of the shared one)
+            history_backend: Optional persistent history store; history is then
+                loaded lazily and every exchange is written through to it
+            session_id: Session key in history_backend (required with it)
+            memory_mode: "window" drops turns that leave the history window;
+                "summary" folds them into a running summary in the background
+                (defaults to settings.MEMORY_MODE)
+            summarizer: Optional summarizer for "summary" mode (defaults to
+                one using this bot's llm)
+            response_cache: Optional cache of answers to context-free
+                questions (defaults to the shared cache when
+                settings.RESPONSE_CACHE_ENABLED is set)
+            router: Optional router answering trivial intents without the
+                agent (defaults to the shared router when
+                settings.FAST_PATH_ENABLED is set)
+            context_cache: Optional provider cache for the static prompt
+                prefix, used with llm (shared agents use the per-model cache
+                when settings.CONTEXT_CACHE_ENABLED is set)
         """
-        self.llm = ChatGoogleGenerativeAI(
-            model=model_name,
-            temperature=temperature
-        )
         self.tools = all_tools
-        self.chat_history = []
-        self.agent_executor = self._create_agent()
+        if llm is None:
+            self.llm, self.agent_executor = self._get_shared_agent(model_name, temperature)
+        else:
+            self.llm = llm
+            self.agent_executor = self._create_agent(self.llm, self.tools, context_cache)
+        self.history_backend = history_backend
+        self.session_id = session_id
+        # Recent history, trimmed to a token budget before each turn
+        self.history_window = HistoryWindow(
+            max_tokens=settings.MAX_HISTORY_TOKENS,
+            max_messages=settings.MAX_HISTORY_LENGTH or None,
+            counter=get_token_counter(settings.TOKEN_COUNTER)
+        )
+        # With a backend, history is loaded on first access
+        self._history_loaded = history_backend is None
+        # Backend message count our local history corresponds to
+        self._persisted_count = 0
+        # Serializes async turns so concurrent requests can't interleave history
+        self._lock = asyncio.Lock()
+        
+        self.memory_mode = (memory_mode or settings.MEMORY_MODE).lower()
+        self.summarizer = summarizer or ConversationSummarizer(self.llm, max_words=settings.SUMMARY_MAX_WORDS)
+        self.summary = ""
+        # Evicted messages waiting to be folded into the summary
+        self._unsummarized = []
+        self._summarizing = False
+        self._summary_future = None
+        self._summary_lock = threading.Lock()
+        # Bumped by clear_history so in-flight folds don't resurrect old turns
+        self._summary_generation = 0
+        
+        self.response_cache = response_cache or self.get_response_cache()
+        self.router = router or self.get_router()
+        # Per-turn spans, served at /session/{id}/trace
+        self.trace_store = trace_store if settings.TRACE_ENABLED else None
+    
+    @property
+    def chat_history(self) -> list:
+        """Recent messages sent to the agent as conversation context."""
+        if not self._history_loaded:
+            self._load_history()
+        return self.history_window.messages
+    
+    @chat_history.setter
+    def chat_history(self, messages: list):
+        self.history_window.replace(messages)
+        self._history_loaded = True
+    
+    def _load_history(self):
+        """Load the recent history window from the backend."""
+        self._persisted_count = self.history_backend.message_count(self.session_id)
+        self.history_window.replace(
+            self.history_backend.load(self.session_id, limit=self.history_window.max_messages)
+        )
+        self._history_loaded = True
+    
+    def _sync_history(self):
+        """Reload history if another worker changed it since we last looked."""
+        if self.history_backend is None:
+            return
+        if (not self._history_loaded
+                or self.history_backend.message_count(self.session_id) != self._persisted_count):
+            self._load_history()
+    
+    async def _async_sync_history(self):
+        """_sync_history() in a worker thread, keeping database reads off the event loop."""
+        if self.history_backend is not None:
+            await asyncio.to_thread(self._sync_history)
+    
+    def _agent_history(self) -> list:
+        """History passed to the prompt: the running summary (if any) plus the window."""
+        history = self.chat_history
+        if self.summary:
+            return [SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}")] + history
+        return history
+    
+    @classmethod
+    def _get_summary_pool(cls) -> ThreadPoolExecutor:
+        with cls._summary_pool_lock:
+            if cls._summary_pool is None:
+                cls._summary_pool = ThreadPoolExecutor(
+                    max_workers=settings.SUMMARY_WORKERS,
+                    thread_name_prefix="summarizer"
+                )
+            return cls._summary_pool
+    
+    def _schedule_summary(self, evicted: list):
+        """Queue evicted messages to be folded into the summary off the request path."""
+        with self._summary_lock:
+            self._unsummarized.extend(evicted)
+            if self._summarizing:
+                return  # The running task picks these up
+            self._summarizing = True
+            self._summary_future = self._get_summary_pool().submit(self._fold_summary)
+    
+    def _fold_summary(self):
+        """Fold queued messages into the summary until none are left (or the summarizer fails)."""
+        while True:
+            with self._summary_lock:
+                batch = self._unsummarized
+                self._unsummarized = []
+                if not batch:
+                    self._summarizing = False
+                    return
+                summary = self.summary
+                generation = self._summary_generation
+            
+            try:
+                summary = self.summarizer.summarize(summary, batch)
+            except Exception as e:
+                # Put the turns back so the next eviction retries them with its own
+                logger.error("Error summarizing conversation, %d messages re-queued: %s", len(batch), e)
+                with self._summary_lock:
+                    if generation == self._summary_generation:
+                        self._unsummarized[:0] = batch
+                    self._summarizing = False
+                return
+            
+            with self._summary_lock:
+                if generation == self._summary_generation:
+                    self.summary = summary
+    
+    def wait_for_summary(self, timeout: Optional[float] = None):
+        """Block until background summarization has caught up."""
+        while True:
+            with self._summary_lock:
+                future = self._summary_future
+                if not self._summarizing:
+                    return
+            future.result(timeout=timeout)
+    
+    @classmethod
+    def get_response_cache(cls) -> Optional["ResponseCache"]:
+        """Return the shared response cache, or None if it's disabled."""
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return None
+        with cls._response_cache_lock:
+            if cls._response_cache is None:
+                # Imported here so numpy is only needed with the cache enabled
+                from response_cache import ResponseCache
+                cls._response_cache = ResponseCache(
+                    threshold=settings.RESPONSE_CACHE_THRESHOLD,
+                    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+                    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+                    bypass_tools=settings.RESPONSE_CACHE_BYPASS_TOOLS
+                )
+            return cls._response_cache
+    
+    @classmethod
+    def get_router(cls) -> Optional[FastPathRouter]:
+        """Return the shared fast-path router, or None if it's disabled."""
+        if not settings.FAST_PATH_ENABLED:
+            return None
+        with cls._router_lock:
+            if cls._router is None:
+                cls._router = build_default_router(all_tools)
+            return cls._router
+    
+    def _fast_path(self, user_input: str) -> Optional[str]:
+        """Answer a trivial intent or command without the agent, if the router knows it."""
+        if self.router is None:
+            return None
+        routed = self.router.answer(user_input)
+        if routed is None:
+            return None
+        route, reply = routed
+        fast_path_hits.labels(route).inc()
+        return reply
+    
+    def _trace(self, method: str):
+        """Trace recorder for a turn, or a no-op context when tracing is off."""
+        if self.trace_store is None:
+            return nullcontext()
+        return self.trace_store.recorder(self.session_id, method)
+    
+    @staticmethod
+    def _callbacks(turn: TurnMetrics, trace: Optional[TraceRecorder]) -> list:
+        """Callback handlers for an agent run."""
+        return [turn] if trace is None else [turn, trace]
+    
+    @staticmethod
+    def _tag(trace: Optional[TraceRecorder], **attributes: Any):
+        """Add attributes to the turn span, if the turn is traced."""
+        if trace is not None:
+            trace.set(**attributes)
+    
+    @staticmethod
+    def _record_error(error: Exception, turn: TurnMetrics, trace: Optional[TraceRecorder]):
+        """Count, trace and log an error handled inside a turn."""
+        turn.record_error(error)
+        if trace is not None:
+            trace.record_error(error)
+        logger.exception("Error processing request: %s", error)
+    
+    def _context_free(self) -> bool:
+        """True if the next turn doesn't depend on earlier conversation."""
+        return not self.chat_history and not self.summary
+    
+    def _cached_response(self, user_input: str) -> Optional[str]:
+        """Return a cached answer for a context-free question, if any."""
+        if self.response_cache is None or not self._context_free():
+            return None
+        return self.response_cache.lookup(user_input)
+    
+    def _cache_response(self, user_input: str, output: Optional[str], tools_used: List[str]):
+        """Store an answer produced without conversation context."""
+        if self.response_cache is None or not output or output.startswith("Agent stopped"):
+            return
+        self.response_cache.store(user_input, output, tools_used)
+    
+    @staticmethod
+    def _tools_used(response: Dict[str, Any]) -> List[str]:
+        """Names of the tools called during an agent run."""
+        return [action.tool for action, _ in response.get("intermediate_steps", [])]
+    
+    @classmethod
+    def _get_shared_agent(cls, model_name: str, temperature: float) -> Tuple[BaseChatModel, "AgentExecutor"]:
+        """Return the shared (llm, agent_executor) pair for a model configuration."""
+        key = (model_name, temperature)
+        with cls._shared_agents_lock:
+            if key not in cls._shared_agents:
+                # Imported here: the Google client stack takes about a second to
+                # import and isn't needed by tests, batch jobs on other models
+                # or the CLI before the first message
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                llm = ChatGoogleGenerativeAI(
+                    model=model_name,
+                    temperature=temperature
+                )
+                cls._shared_agents[key] = (
+                    llm, cls._create_agent(llm, all_tools, cls.get_context_cache(model_name))
+                )
+            return cls._shared_agents[key]
+    
+    @classmethod
+    def get_context_cache(cls, model_name: str) -> Optional[ContextCacheManager]:
+        """Return the shared prompt cache for a model, or None if it's disabled."""
+        if not settings.CONTEXT_CACHE_ENABLED:
+            return None
+        with cls._context_caches_lock:
+            if model_name not in cls._context_caches:
+                cls._context_caches[model_name] = ContextCacheManager(
+                    GeminiContextCacheProvider(),
+                    model_name,
+                    SYSTEM_PROMPT,
+                    all_tools,
+                    ttl_seconds=settings.CONTEXT_CACHE_TTL_SECONDS,
+                    refresh_seconds=settings.CONTEXT_CACHE_REFRESH_SECONDS
+                )
+            return cls._context_caches[model_name]
+    
+    @classmethod
+    def context_cache_stats(cls) -> List[Dict[str, Any]]:
+        """Stats of every prompt cache in use."""
+        with cls._context_caches_lock:
+            managers = list(cls._context_caches.values())
+        return [manager.stats() for manager in managers]
     
-    def _create_agent(self) -> AgentExecutor:
+    @classmethod
+    def close_context_caches(cls):
+        """Delete the provider-side prompt caches (on shutdown)."""
+        with cls._context_caches_lock:
+            managers = list(cls._context_caches.values())
+        for manager in managers:
+            manager.close()
+    
+    @staticmethod
+    def _create_agent(
+        llm: BaseChatModel,
+        tools: List,
+        context_cache: Optional[ContextCacheManager] = None
+    ) -> "AgentExecutor":
         """Create the agent with tools and prompt template."""
+        # Imported here: the langchain.agents package pulls in
+        # langchain_community (and aiohttp) on import
+        from langchain.agents import create_tool_calling_agent, AgentExecutor
+        from langchain.agents.format_scratchpad.tools import format_to_tool_messages
+        from langchain.agents.output_parsers.tools import ToolsAgentOutputParser
+        from executor import ConcurrentAgentExecutor
+        
         prompt = ChatPromptTemplate.from_messages([
-            (
-                "system",
-                """You are a helpful AI assistant with access to various tools.
-                
-Your capabilities include:
-- Searching Wikipedia for detailed information
-- Searching the web for current information
-- Saving content to files
-- Getting the current date and time
-
-Always be helpful, accurate, and cite your sources when using tools.
-When saving information, provide a clear summary of what was saved.
-If you're unsure about something, say so rather than making up information.
-                """
-            ),
+            ("system", SYSTEM_PROMPT),
             ("placeholder", "{chat_history}"),
             ("human", "{input}"),
             ("placeholder", "{agent_scratchpad}"),
         ])
         
-        agent = create_tool_calling_agent(
-            llm=self.llm,
-            prompt=prompt,
-            tools=self.tools
-        )
+        if context_cache is None:
+            agent = create_tool_calling_agent(
+                llm=llm,
+                prompt=prompt,
+                tools=tools
+            )
+        else:
+            # Same pipeline as create_tool_calling_agent, with the model
+            # referencing the cached prompt prefix instead of resending it
+            agent = (
+                RunnablePassthrough.assign(
+                    agent_scratchpad=lambda x: format_to_tool_messages(x["intermediate_steps"])
+                )
+                | prompt
+                | with_context_cache(llm, tools, context_cache)
+                | ToolsAgentOutputParser()
+            )
         
-        return AgentExecutor(
+        if settings.TOOL_DISPATCH.lower() == "sequential":
+            return AgentExecutor(
+                agent=agent,
+                tools=tools,
+                verbose=settings.VERBOSE,
+                handle_parsing_errors=True,
+                max_iterations=5,
+                return_intermediate_steps=True
+            )
+        
+        # Run all tool calls from one LLM turn in parallel, with timeouts
+        return ConcurrentAgentExecutor(
             agent=agent,
-            tools=self.tools,
-            verbose=True,
+            tools=tools,
+            verbose=settings.VERBOSE,
             handle_parsing_errors=True,
-            max_iterations=5
+            max_iterations=5,
+            return_intermediate_steps=True,
+            max_tool_workers=settings.TOOL_MAX_WORKERS,
+            tool_timeout=settings.TOOL_TIMEOUT_SECONDS,
+            tool_timeouts=settings.TOOL_TIMEOUTS
         )
     
     def chat(self, user_input: str) -> str:
@@ -87,43 +463,246 @@ If you're unsure about something, say so rather than making up information.
         Returns:
             The AI's response
         """
-        try:
-            # Invoke agent
-            response = self.agent_executor.invoke({
-                "input": user_input,
-                "chat_history": self.chat_history
-            })
-            
-            # Extract output
-            output = response.get("output", "I'm sorry, I couldn't process that request.")
-            
-            # Update chat history
-            self.chat_history.append(HumanMessage(content=user_input))
-            self.chat_history.append(AIMessage(content=output))
-            
-            # Limit chat history to last 10 messages (5 exchanges)
-            if len(self.chat_history) > 10:
-                self.chat_history = self.chat_history[-10:]
+        with TurnMetrics("chat") as turn, self._trace("chat") as trace:
+            try:
+                self._sync_history()
+                
+                # Trivial intents ("what time is it?") skip the LLM loop entirely
+                reply = self._fast_path(user_input)
+                if reply is not None:
+                    self._tag(trace, fast_path=True)
+                    self._record_exchange(user_input, reply)
+                    return reply
+                
+                # Answer repeated context-free questions without running the agent
+                context_free = self._context_free()
+                cached = self._cached_response(user_input)
+                if cached is not None:
+                    response_cache_hits.inc()
+                    self._tag(trace, cached=True)
+                    self._record_exchange(user_input, cached)
+                    return cached
+                
+                # Invoke agent
+                response = self.agent_executor.invoke(
+                    {"input": user_input, "chat_history": self._agent_history()},
+                    config={"callbacks": self._callbacks(turn, trace)}
+                )
+                turn.record_output(response.get("output"))
+                
+                # Extract output
+                output = response.get("output", "I'm sorry, I couldn't process that request.")
+                
+                self._record_exchange(user_input, output)
+                if context_free:
+                    self._cache_response(user_input, response.get("output"), self._tools_used(response))
+                
+                return output
+                
+            except Exception as e:
+                self._record_error(e, turn, trace)
+                return "I apologize, but I encountered an error processing your request. Please try again."
+    
+    async def achat(self, user_input: str, raise_errors: bool = False) -> str:
+        """
+        Async version of chat() that doesn't block the event loop.
+        
+        Turns on the same bot are serialized by a lock, so concurrent
+        requests for one session can't interleave their history updates.
+        
+        Args:
+            user_input: The user's message
+            raise_errors: Re-raise a failed turn's exception (after counting
+                and logging it) instead of returning an apology
             
-            return output
+        Returns:
+            The AI's response
+        """
+        async with self._lock:
+            with TurnMetrics("achat") as turn, self._trace("achat") as trace:
+                try:
+                    await self._async_sync_history()
+                    
+                    reply = self._fast_path(user_input)
+                    if reply is not None:
+                        self._tag(trace, fast_path=True)
+                        self._record_exchange(user_input, reply)
+                        return reply
+                    
+                    context_free = self._context_free()
+                    cached = self._cached_response(user_input)
+                    if cached is not None:
+                        response_cache_hits.inc()
+                        self._tag(trace, cached=True)
+                        self._record_exchange(user_input, cached)
+                        return cached
+                    
+                    response = await self.agent_executor.ainvoke(
+                        {"input": user_input, "chat_history": self._agent_history()},
+                        config={"callbacks": self._callbacks(turn, trace)}
+                    )
+                    turn.record_output(response.get("output"))
+                    
+                    output = response.get("output", "I'm sorry, I couldn't process that request.")
+                    
+                    self._record_exchange(user_input, output)
+                    if context_free:
+                        self._cache_response(user_input, response.get("output"), self._tools_used(response))
+                    
+                    return output
+                    
+                except Exception as e:
+                    self._record_error(e, turn, trace)
+                    if raise_errors:
+                        raise
+                    return "I apologize, but I encountered an error processing your request. Please try again."
+    
+    async def astream_chat(self, user_input: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a chat turn as it happens.
+        
+        Yields event dicts with an "event" name and a "data" payload:
+        "token" for each LLM token, "tool_start"/"tool_end" around tool
+        calls, then "done" with the final response (or "error"). History is
+        updated once the agent run completes.
+        
+        Args:
+            user_input: The user's message
             
-        except Exception as e:
-            error_msg = f"Error processing request: {str(e)}"
-            print(error_msg)
-            return "I apologize, but I encountered an error processing your request. Please try again."
+        Yields:
+            Event dictionaries in the order they occur
+        """
+        async with self._lock:
+            with TurnMetrics("stream") as turn, self._trace("stream") as trace:
+                output = None
+                tools_used = []
+                try:
+                    await self._async_sync_history()
+                    
+                    reply = self._fast_path(user_input)
+                    if reply is not None:
+                        self._tag(trace, fast_path=True)
+                        self._record_exchange(user_input, reply)
+                        yield {"event": "token", "data": {"content": reply}}
+                        yield {"event": "done", "data": {"response": reply, "fast_path": True}}
+                        return
+                    
+                    context_free = self._context_free()
+                    cached = self._cached_response(user_input)
+                    if cached is not None:
+                        response_cache_hits.inc()
+                        self._tag(trace, cached=True)
+                        self._record_exchange(user_input, cached)
+                        yield {"event": "token", "data": {"content": cached}}
+                        yield {"event": "done", "data": {"response": cached, "cached": True}}
+                        return
+                    
+                    async for event in self.agent_executor.astream_events(
+                        {"input": user_input, "chat_history": self._agent_history()},
+                        config={"callbacks": self._callbacks(turn, trace)},
+                        version="v2"
+                    ):
+                        kind = event["event"]
+                        
+                        if kind == "on_chat_model_stream":
+                            token = event["data"]["chunk"].content
+                            if token and isinstance(token, str):
+                                yield {"event": "token", "data": {"content": token}}
+                        
+                        elif kind == "on_tool_start":
+                            tools_used.append(event["name"])
+                            yield {
+                                "event": "tool_start",
+                                "data": {"tool": event["name"], "input": event["data"].get("input")}
+                            }
+                        
+                        elif kind == "on_tool_end":
+                            result = event["data"].get("output")
+                            yield {
+                                "event": "tool_end",
+                                "data": {"tool": event["name"], "output": str(getattr(result, "content", result))}
+                            }
+                        
+                        elif kind == "on_chain_end" and not event["parent_ids"]:
+                            # Top-level AgentExecutor run finished
+                            output = event["data"]["output"].get("output")
+                
+                except Exception as e:
+                    self._record_error(e, turn, trace)
+                    yield {
+                        "event": "error",
+                        "data": {"detail": "I apologize, but I encountered an error processing your request. Please try again."}
+                    }
+                    return
+                
+                turn.record_output(output)
+                if context_free:
+                    self._cache_response(user_input, output, tools_used)
+                output = output or "I'm sorry, I couldn't process that request."
+                self._record_exchange(user_input, output)
+                
+                yield {"event": "done", "data": {"response": output}}
+    
+    def _record_exchange(self, user_input: str, output: str):
+        """Append a user/AI exchange to the chat history."""
+        exchange = [HumanMessage(content=user_input), AIMessage(content=output)]
+        if not self._history_loaded:
+            self._load_history()
+        self.history_window.extend(exchange)
+        
+        if self.history_backend is not None:
+            self.history_backend.append(self.session_id, exchange)
+            self._persisted_count += len(exchange)
+        
+        # Drop the oldest messages once over the token/message budget
+        evicted = self.history_window.trim()
+        if evicted and self.memory_mode == "summary":
+            self._schedule_summary(evicted)
     
     def clear_history(self):
         """Clear the chat history."""
         self.chat_history = []
-        print("Chat history cleared.")
+        with self._summary_lock:
+            self.summary = ""
+            self._unsummarized = []
+            self._summary_generation += 1
+        if self.history_backend is not None:
+            self.history_backend.clear(self.session_id)
+            self._persisted_count = 0
+        logger.debug("Chat history cleared")
     
     def get_history(self) -> list:
         """Get the current chat history."""
         return self.chat_history
 
 
-def main():
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="LangChain AI Assistant")
+    parser.add_argument("--batch", metavar="IN_JSONL", help="Answer every prompt in a JSONL file and exit")
+    parser.add_argument("--out", metavar="OUT_JSONL", help="Where --batch writes (and resumes) results")
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.BATCH_CONCURRENCY,
+        help="Prompts processed at once in batch mode"
+    )
+    args = parser.parse_args(argv)
+    if args.batch and not args.out:
+        parser.error("--batch requires --out")
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
     """Main function to run the chatbot."""
+    args = parse_args(argv)
+    settings.configure_logging()
+    if args.batch:
+        from batch import run_batch
+        asyncio.run(run_batch(
+            args.batch, args.out, concurrency=args.concurrency,
+            retries=settings.BATCH_RETRIES, retry_backoff=settings.BATCH_RETRY_BACKOFF_SECONDS
+        ))
+        return
+    
     print("=" * 60)
     print("🤖 LangChain AI Assistant")
     print("=" * 60)
@@ -151,6 +730,7 @@ def main():
             
             elif user_input.lower() == 'clear':
                 bot.clear_history()
+                print("Chat history cleared.")
                 continue
             
             elif user_input.lower() == 'history':
@@ -0,0 +1,232 @@
+"""
+Conversation memory: token counting, the token-budgeted history window and
+rolling summaries of evicted turns.
+"""
+import functools
+import math
+import re
+from collections import deque
+from typing import Callable, Deque, Iterable, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+
+# Extra tokens a chat message costs beyond its text (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_PIECES = re.compile(r"[A-Za-z]+|\d+|\S")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of text.
+
+    Closer to real BPE tokenizers than utils.count_tokens_estimate
+    (len // 4), which badly undercounts punctuation-heavy text, numbers and
+    non-Latin scripts: Latin words cost one token per six letters (common
+    words are a single token), digit runs one per three digits, and
+    punctuation and other characters (CJK, emoji, ...) one each.
+
+    Args:
+        text: Text to count tokens for
+
+    Returns:
+        Estimated token count
+    """
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            tokens += math.ceil(len(piece) / 6)
+        elif first.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+@functools.lru_cache(maxsize=None)
+def get_token_counter(name: str = "heuristic") -> Callable[[str], int]:
+    """
+    Return a token counting function by name.
+
+    Args:
+        name: "heuristic" (estimate_tokens), "chars" (len // 4) or
+            "tiktoken" (exact cl100k counts; requires the tiktoken package)
+
+    Returns:
+        Function mapping text to a token count
+    """
+    name = name.lower()
+    if name == "heuristic":
+        return estimate_tokens
+    if name == "chars":
+        from utils import count_tokens_estimate
+        return count_tokens_estimate
+    if name == "tiktoken":
+        try:
+            import tiktoken
+        except ImportError:
+            raise ImportError("TOKEN_COUNTER=tiktoken requires the tiktoken package: pip install tiktoken")
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    raise ValueError(f"Unknown token counter: {name}")
+
+
+def message_text(message: BaseMessage) -> str:
+    """Return the text content of a message, flattening multi-part content."""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(
+        part if isinstance(part, str) else str(part.get("text", ""))
+        for part in content
+    )
+
+
+class HistoryWindow:
+    """
+    Recent chat history trimmed to a token budget.
+
+    Each message is counted once when it is added and its count is kept
+    alongside it, so trimming never re-tokenizes. Oldest messages are
+    evicted first, and the window never starts with an AI message.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 4000,
+        max_messages: Optional[int] = None,
+        counter: Callable[[str], int] = estimate_tokens
+    ):
+        """
+        Initialize an empty window.
+
+        Args:
+            max_tokens: Token budget for the whole window (0 = unlimited)
+            max_messages: Optional cap on the number of messages
+            counter: Function mapping text to a token count
+        """
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.counter = counter
+        self._messages: List[BaseMessage] = []
+        self._counts: Deque[int] = deque()
+        self._total = 0
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Messages currently in the window, oldest first."""
+        return self._messages
+
+    @property
+    def total_tokens(self) -> int:
+        """Token count of the window."""
+        return self._total
+
+    def count(self, message: BaseMessage) -> int:
+        """Return the token cost of one message."""
+        return self.counter(message_text(message)) + MESSAGE_OVERHEAD_TOKENS
+
+    def append(self, message: BaseMessage) -> None:
+        """Add a message to the end of the window (without trimming)."""
+        tokens = self.count(message)
+        self._messages.append(message)
+        self._counts.append(tokens)
+        self._total += tokens
+
+    def extend(self, messages: Iterable[BaseMessage]) -> None:
+        """Add several messages to the end of the window (without trimming)."""
+        for message in messages:
+            self.append(message)
+
+    def _over_budget(self, message_count: int) -> bool:
+        if self.max_messages and message_count > self.max_messages:
+            return True
+        return bool(self.max_tokens) and self._total > self.max_tokens
+
+    def trim(self) -> List[BaseMessage]:
+        """
+        Evict the oldest messages until the window fits its limits.
+
+        Returns:
+            The evicted messages, oldest first
+        """
+        size = len(self._messages)
+        evict = 0
+        while evict < size and self._over_budget(size - evict):
+            self._total -= self._counts.popleft()
+            evict += 1
+        # Don't leave an answer without its question at the start
+        while evict and evict < size and self._messages[evict].type == "ai":
+            self._total -= self._counts.popleft()
+            evict += 1
+
+        evicted = self._messages[:evict]
+        del self._messages[:evict]
+        return evicted
+
+    def replace(self, messages: Iterable[BaseMessage]) -> List[BaseMessage]:
+        """
+        Replace the window contents and trim.
+
+        Returns:
+            Messages that didn't fit
+        """
+        self.clear()
+        self.extend(messages)
+        return self.trim()
+
+    def clear(self) -> None:
+        """Remove all messages."""
+        self._messages = []
+        self._counts.clear()
+        self._total = 0
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+
+SUMMARY_PROMPT = """Progressively summarize the conversation below, adding onto the previous summary and returning a new summary.
+Keep names, facts, decisions and open questions the user may refer back to. Use at most {max_words} words.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{lines}
+
+New summary:"""
+
+
+class ConversationSummarizer:
+    """Folds conversation turns into a running summary with an LLM."""
+
+    def __init__(self, llm: BaseChatModel, max_words: int = 200):
+        """
+        Initialize the summarizer.
+
+        Args:
+            llm: Chat model used to write the summary
+            max_words: Target upper bound for the summary length
+        """
+        self.llm = llm
+        self.max_words = max_words
+
+    def summarize(self, summary: str, messages: List[BaseMessage]) -> str:
+        """
+        Return a new summary covering the old summary plus messages.
+
+        Args:
+            summary: Current running summary (may be empty)
+            messages: Turns to fold in, oldest first
+
+        Returns:
+            The updated summary
+        """
+        lines = "\n".join(
+            f"{'User' if message.type == 'human' else 'AI'}: {message_text(message)}"
+            for message in messages
+        )
+        prompt = SUMMARY_PROMPT.format(max_words=self.max_words, summary=summary or "(none)", lines=lines)
+        return message_text(self.llm.invoke(prompt)).strip()
@@ -0,0 +1,374 @@
+"""
+Prometheus-style metrics for the chatbot.
+
+A small self-contained registry (no prometheus_client dependency) with
+counters, gauges and histograms, rendered in the Prometheus text exposition
+format, plus a callback handler that times each stage of an agent run.
+"""
+import bisect
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Seconds; wide enough for LLM calls and slow tools
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Final answer AgentExecutor returns when it runs out of iterations
+MAX_ITERATIONS_OUTPUT = "Agent stopped due to max iterations."
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base class: a named metric with one child per label combination."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: Any, **kwargs: Any):
+        """Return the child for a label combination (positional or by name)."""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Return this metric in Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        """Increment the unlabelled counter."""
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            children = sorted(self._children.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in children
+        ]
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        """Decrement the unlabelled gauge."""
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        """Set the unlabelled gauge."""
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        """Record a value in the unlabelled histogram."""
+        self.labels().observe(value)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            children = sorted(self._children.items())
+        lines = []
+        for key, child in children:
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        """Create and register a counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        """Create and register a gauge."""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """Create and register a histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Return all metrics in Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "chatbot_request_duration_seconds", "Total time of a chat turn.", ["method"]
+)
+requests_in_flight = registry.gauge(
+    "chatbot_requests_in_flight", "Chat turns currently being processed."
+)
+prompt_build_duration = registry.histogram(
+    "chatbot_prompt_build_duration_seconds", "Time spent formatting the agent prompt."
+)
+llm_duration = registry.histogram(
+    "chatbot_llm_duration_seconds", "Duration of each LLM call.", ["model"]
+)
+tool_duration = registry.histogram(
+    "chatbot_tool_duration_seconds", "Duration of each tool call.", ["tool"]
+)
+llm_input_tokens = registry.counter(
+    "chatbot_llm_input_tokens_total", "Input tokens sent to the LLM, including cached ones.", ["model"]
+)
+llm_cached_tokens = registry.counter(
+    "chatbot_llm_cached_input_tokens_total", "Input tokens the provider read from a context cache.", ["model"]
+)
+agent_iterations = registry.histogram(
+    "chatbot_agent_iterations", "Agent iterations (LLM calls) per chat turn.",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10)
+)
+max_iterations_hits = registry.counter(
+    "chatbot_max_iterations_total", "Chat turns stopped by the agent's max_iterations limit."
+)
+errors = registry.counter(
+    "chatbot_errors_total", "Errors by stage and exception type.", ["stage", "type"]
+)
+response_cache_hits = registry.counter(
+    "chatbot_response_cache_hits_total", "Chat turns answered from the response cache."
+)
+fast_path_hits = registry.counter(
+    "chatbot_fast_path_total", "Chat turns answered by the fast-path router.", ["route"]
+)
+admission_wait = registry.histogram(
+    "chatbot_admission_wait_seconds", "Time chat requests waited for an admission slot."
+)
+admission_queue_depth = registry.gauge(
+    "chatbot_admission_queue_depth", "Chat requests waiting for an admission slot."
+)
+admission_rejections = registry.counter(
+    "chatbot_admission_rejected_total", "Chat requests rejected with 429 by admission control.", ["reason"]
+)
+sessions = registry.gauge(
+    "chatbot_sessions", "Live API sessions in this worker."
+)
+
+
+class TurnMetrics(BaseCallbackHandler):
+    """
+    Callback handler that records the metrics of one chat turn.
+
+    Use as a context manager around the turn and pass it in the agent's
+    callbacks; it times the prompt, LLM and tool runs it sees, counts LLM
+    calls as agent iterations and tracks the turn's total duration, in-flight
+    count and errors.
+    """
+
+    # Only bookkeeping; safe to run on the event loop
+    run_inline = True
+
+    def __init__(self, method: str):
+        """
+        Args:
+            method: Label for the request duration ("chat", "achat", "stream")
+        """
+        self.method = method
+        self.llm_calls = 0
+        self._starts: Dict[UUID, Tuple[float, Any, str]] = {}
+        self._models: Dict[UUID, str] = {}
+        self._started_at: Optional[float] = None
+
+    def __enter__(self) -> "TurnMetrics":
+        self._started_at = time.perf_counter()
+        requests_in_flight.inc()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        requests_in_flight.dec()
+        request_duration.labels(self.method).observe(time.perf_counter() - self._started_at)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            errors.labels("request", exc_type.__name__).inc()
+        return False
+
+    def record_output(self, output: Optional[str]):
+        """Record the iteration count of a completed agent run."""
+        agent_iterations.observe(self.llm_calls)
+        if output == MAX_ITERATIONS_OUTPUT:
+            max_iterations_hits.inc()
+
+    def record_error(self, error: BaseException, stage: str = "request"):
+        """Count an error that was handled inside the turn."""
+        errors.labels(stage, type(error).__name__).inc()
+
+    def _start(self, run_id: UUID, histogram: Any, stage: str):
+        self._starts[run_id] = (time.perf_counter(), histogram, stage)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None):
+        started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        start, histogram, stage = started
+        histogram.observe(time.perf_counter() - start)
+        if error is not None:
+            self.record_error(error, stage)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, run_type=None, **kwargs):
+        if run_type == "prompt":
+            self._start(run_id, prompt_build_duration.labels(), "prompt")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or params.get("_type") or "unknown"
+        self.llm_calls += 1
+        self._models[run_id] = model
+        self._start(run_id, llm_duration.labels(model), "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+        model = self._models.pop(run_id, "unknown")
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    llm_input_tokens.labels(model).inc(usage.get("input_tokens", 0))
+                    details = usage.get("input_token_details") or {}
+                    llm_cached_tokens.labels(model).inc(details.get("cache_read", 0) or 0)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._models.pop(run_id, None)
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "unknown"
+        self._start(run_id, tool_duration.labels(name), "tool")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
@@ -0,0 +1,215 @@
+"""
+Semantic cache for complete chatbot responses.
+"""
+import re
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Questions about "now" must always reach the agent
+DEFAULT_BYPASS_PATTERNS = [
+    r"\b(time|date|day|today|tonight|tomorrow|yesterday|now|current(ly)?|latest|recent|news|weather)\b",
+]
+
+# Answers produced with these tools are time-sensitive or have side effects
+DEFAULT_BYPASS_TOOLS = ["CurrentTime", "WebSearch", "SaveToFile"]
+
+_WORDS = re.compile(r"\w+")
+
+
+def normalize_question(text: str) -> str:
+    """
+    Normalize a question for exact matching.
+
+    Args:
+        text: Raw user message
+
+    Returns:
+        Lower-cased words separated by single spaces, punctuation removed
+    """
+    return " ".join(_WORDS.findall(text.casefold()))
+
+
+class HashingVectorizer:
+    """
+    Stateless text vectorizer using the hashing trick.
+
+    Words, word bigrams and character trigrams are hashed (CRC32, so stable
+    across processes) into a fixed number of signed buckets and the result
+    is L2-normalized, so a dot product is the cosine similarity. Character
+    trigrams make near-duplicates with typos or reordered words score high.
+    """
+
+    def __init__(self, dim: int = 1024):
+        """
+        Args:
+            dim: Number of hash buckets (vector length)
+        """
+        self.dim = dim
+
+    def _features(self, text: str) -> Iterable[tuple]:
+        words = normalize_question(text).split()
+        for word in words:
+            yield "w:" + word, 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield "c:" + padded[i:i + 3], 0.5
+        for first, second in zip(words, words[1:]):
+            yield f"b:{first} {second}", 1.0
+
+    def transform(self, text: str) -> np.ndarray:
+        """Return the normalized feature vector for text."""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = float(np.linalg.norm(vector))
+        if norm:
+            vector /= norm
+        return vector
+
+
+class ResponseCache:
+    """
+    Response cache with exact and similarity matching.
+
+    Lookups first try an exact match on the normalized question, then a
+    cosine-similarity search over the vectors of all cached questions (one
+    matrix-vector product). Entries expire after ttl_seconds; once full,
+    the oldest entry is overwritten.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        ttl_seconds: float = 3600,
+        max_entries: int = 1000,
+        bypass_patterns: Optional[List[str]] = None,
+        bypass_tools: Optional[List[str]] = None,
+        vectorizer: Optional[HashingVectorizer] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            threshold: Minimum cosine similarity for a similarity hit (0-1)
+            ttl_seconds: How long a cached response stays valid
+            max_entries: Maximum number of cached responses
+            bypass_patterns: Regexes; matching questions skip the cache entirely
+            bypass_tools: Responses that used any of these tools aren't cached
+            vectorizer: Text vectorizer (HashingVectorizer by default)
+            clock: Monotonic time source (overridable for tests)
+        """
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        patterns = DEFAULT_BYPASS_PATTERNS if bypass_patterns is None else bypass_patterns
+        self.bypass_patterns = [re.compile(p, re.IGNORECASE) for p in patterns]
+        self.bypass_tools = set(DEFAULT_BYPASS_TOOLS if bypass_tools is None else bypass_tools)
+        self.vectorizer = vectorizer or HashingVectorizer()
+        self._clock = clock
+
+        self._matrix = np.zeros((max_entries, self.vectorizer.dim), dtype=np.float32)
+        self._expires = np.full(max_entries, -np.inf)
+        self._keys: List[Optional[str]] = [None] * max_entries
+        self._responses: List[Optional[str]] = [None] * max_entries
+        self._exact: Dict[str, int] = {}
+        self._next_slot = 0
+        self._lock = threading.Lock()
+
+        self._stats = {"lookups": 0, "exact_hits": 0, "similar_hits": 0, "misses": 0, "bypassed": 0, "stored": 0}
+
+    def should_bypass(self, question: str) -> bool:
+        """Return True if the question is time-sensitive and must not be cached."""
+        return any(pattern.search(question) for pattern in self.bypass_patterns)
+
+    def lookup(self, question: str) -> Optional[str]:
+        """
+        Return a cached response for the question, or None.
+
+        Args:
+            question: The user's message
+
+        Returns:
+            The cached response, or None on a miss or bypass
+        """
+        if self.should_bypass(question):
+            with self._lock:
+                self._stats["bypassed"] += 1
+            return None
+
+        key = normalize_question(question)
+        with self._lock:
+            self._stats["lookups"] += 1
+            now = self._clock()
+
+            slot = self._exact.get(key)
+            if slot is not None and self._expires[slot] > now:
+                self._stats["exact_hits"] += 1
+                return self._responses[slot]
+
+        vector = self.vectorizer.transform(question)
+        with self._lock:
+            now = self._clock()
+            scores = self._matrix @ vector
+            scores[self._expires <= now] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                self._stats["similar_hits"] += 1
+                return self._responses[best]
+
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, question: str, response: str, tools_used: Iterable[str] = ()) -> bool:
+        """
+        Cache a response unless the question or the tools used rule it out.
+
+        Args:
+            question: The user's message
+            response: The agent's final answer
+            tools_used: Names of tools the agent called for this answer
+
+        Returns:
+            True if the response was cached
+        """
+        if self.should_bypass(question) or self.bypass_tools.intersection(tools_used):
+            return False
+
+        key = normalize_question(question)
+        vector = self.vectorizer.transform(question)
+        with self._lock:
+            slot = self._exact.get(key)
+            if slot is None:
+                slot = self._next_slot
+                self._next_slot = (self._next_slot + 1) % self.max_entries
+                old_key = self._keys[slot]
+                if old_key is not None:
+                    del self._exact[old_key]
+                self._exact[key] = slot
+                self._keys[slot] = key
+
+            self._matrix[slot] = vector
+            self._responses[slot] = response
+            self._expires[slot] = self._clock() + self.ttl_seconds
+            self._stats["stored"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report hit-rate metrics.
+
+        Returns:
+            Dictionary of counters and the overall hit rate
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = int((self._expires > self._clock()).sum())
+        hits = stats["exact_hits"] + stats["similar_hits"]
+        stats["hit_rate"] = round(hits / stats["lookups"], 4) if stats["lookups"] else 0.0
+        stats["threshold"] = self.threshold
+        return stats
@@ -0,0 +1,194 @@
+"""
+Deterministic fast path in front of the agent.
+
+Trivial intents ("what time is it?") and slash commands ("/time") are
+answered by plain functions instead of an LLM round trip through the
+agent. Patterns match the whole normalized message, so anything with
+extra content ("what time is it in Tokyo?") falls through to the agent.
+"""
+import re
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Match, NamedTuple, Optional, Pattern, Sequence, Tuple, Union
+
+from langchain_core.tools import BaseTool
+
+# Handlers get the regex match and return the reply, or None to fall through
+Handler = Callable[[Match], Optional[str]]
+
+# Politeness and filler that don't change a trivial intent
+_PREFIX = r"(?:(?:hey|hi|ok|okay|so|please|can you tell me|could you tell me|do you know|tell me)[\s,]+)*"
+_SUFFIX = r"(?:[\s,]+(?:please|now|right now|today|currently|exactly))*"
+
+
+def normalize_input(user_input: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    return " ".join(user_input.lower().split()).rstrip(" ?!.")
+
+
+def intent(*phrasings: str) -> Pattern:
+    """
+    Compile phrasings into one whole-message pattern.
+
+    Each phrasing is a regex fragment; common filler words ("please",
+    "can you tell me", "right now") are allowed around it.
+    """
+    body = "|".join(f"(?:{phrasing})" for phrasing in phrasings)
+    return re.compile(rf"^{_PREFIX}(?:{body}){_SUFFIX}$")
+
+
+class Route(NamedTuple):
+    """A named set of patterns and the handler that answers them."""
+    name: str
+    patterns: Sequence[Pattern]
+    handler: Handler
+
+
+class FastPathRouter:
+    """
+    Ordered list of routes tried before the agent runs.
+
+    The first route whose pattern matches and whose handler returns a
+    reply wins. Counts of routed and fall-through turns are kept for
+    /health.
+    """
+
+    def __init__(self, routes: Iterable[Route] = ()):
+        """
+        Args:
+            routes: Initial routes, tried in order
+        """
+        self._routes: List[Route] = list(routes)
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses = 0
+
+    def add(
+        self,
+        name: str,
+        patterns: Union[str, Pattern, Sequence[Union[str, Pattern]]],
+        handler: Handler
+    ) -> Route:
+        """
+        Register a route.
+
+        Args:
+            name: Route name used in stats and metrics
+            patterns: Regex(es) matched against the whole normalized message
+            handler: Called with the match; returns the reply or None
+
+        Returns:
+            The new route
+        """
+        if isinstance(patterns, (str, re.Pattern)):
+            patterns = [patterns]
+        compiled = [re.compile(p) if isinstance(p, str) else p for p in patterns]
+        route = Route(name, compiled, handler)
+        with self._lock:
+            self._routes.append(route)
+        return route
+
+    def add_tool(
+        self,
+        tool: BaseTool,
+        patterns: Union[str, Pattern, Sequence[Union[str, Pattern]]],
+        format_reply: Callable[[str], str] = str
+    ) -> Route:
+        """
+        Register a route that answers by running a tool with empty input.
+
+        Args:
+            tool: Tool to run (e.g. CurrentTime)
+            patterns: Regex(es) matched against the whole normalized message
+            format_reply: Turns the tool output into the reply
+
+        Returns:
+            The new route
+        """
+        return self.add(tool.name, patterns, lambda match: format_reply(tool.run("")))
+
+    def answer(self, user_input: str) -> Optional[Tuple[str, str]]:
+        """
+        Answer a message on the fast path.
+
+        Args:
+            user_input: The user's message
+
+        Returns:
+            (route name, reply), or None if the agent should handle it
+        """
+        text = normalize_input(user_input)
+        for route in self._routes:
+            for pattern in route.patterns:
+                match = pattern.match(text)
+                if match is None:
+                    continue
+                reply = route.handler(match)
+                if reply is not None:
+                    with self._lock:
+                        self._hits[route.name] = self._hits.get(route.name, 0) + 1
+                    return route.name, reply
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def stats(self) -> Dict[str, object]:
+        """Turns answered per route, fall-throughs and the fast-path rate."""
+        with self._lock:
+            hits = dict(self._hits)
+            misses = self._misses
+        total = sum(hits.values())
+        return {
+            "routed": total,
+            "fallthrough": misses,
+            "by_route": hits,
+            "fast_path_rate": round(total / (total + misses), 4) if total + misses else 0.0,
+        }
+
+
+# Intents answered from the clock
+TIME_PATTERNS = [
+    intent(
+        r"what(?: is|'s|s)? the (?:current )?time",
+        r"what time is it",
+        r"(?:the )?current time",
+        r"/time",
+    )
+]
+DATE_PATTERNS = [
+    intent(
+        r"what(?: is|'s|s)? (?:the date|today'?s date|the day)",
+        r"what date is it",
+        r"what day is (?:it|today)",
+        r"(?:the )?(?:current|today'?s) date",
+        r"/date",
+    )
+]
+
+
+def _tools_reply(tools: Sequence[BaseTool]) -> str:
+    lines = ["Available tools:"]
+    lines.extend(f"- {tool.name}: {tool.description}" for tool in tools)
+    return "\n".join(lines)
+
+
+def build_default_router(tools: Sequence[BaseTool]) -> FastPathRouter:
+    """
+    Router with the built-in routes for the given tools.
+
+    Time and date questions are answered by the CurrentTime tool (if it's
+    available) and "/tools" lists the tools.
+    """
+    router = FastPathRouter()
+    by_name = {tool.name: tool for tool in tools}
+
+    time_tool = by_name.get("CurrentTime")
+    if time_tool is not None:
+        router.add_tool(time_tool, TIME_PATTERNS, lambda now: f"The current date and time is {now}.")
+        router.add(
+            "CurrentDate", DATE_PATTERNS,
+            lambda match: f"Today is {datetime.now().strftime('%A, %Y-%m-%d')}."
+        )
+
+    router.add("tools", intent(r"/tools", r"/help"), lambda match: _tools_reply(tools))
+    return router
@@ -0,0 +1,605 @@
+"""
+Session storage for the API server.
+"""
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+logger = logging.getLogger(__name__)
+
+# Rough per-object overhead of a LangChain message (pydantic model + dicts)
+MESSAGE_OVERHEAD_BYTES = 600
+# Rough fixed cost of a session entry (ChatBot instance, lock, dict)
+SESSION_OVERHEAD_BYTES = 1200
+
+
+def estimate_session_bytes(session: Dict[str, Any]) -> int:
+    """
+    Approximate the memory held by one session entry.
+
+    Args:
+        session: Session dictionary with a "bot" key
+
+    Returns:
+        Estimated size in bytes
+    """
+    size = SESSION_OVERHEAD_BYTES
+    bot = session.get("bot")
+    if bot is not None:
+        for msg in bot.get_history():
+            content = msg.content if hasattr(msg, 'content') else msg
+            size += MESSAGE_OVERHEAD_BYTES + sys.getsizeof(content)
+    return size
+
+
+class SessionStore:
+    """
+    Bounded, thread-safe session store with LRU eviction and idle TTL.
+
+    Behaves like a dict of session_id -> session. Reading a session marks it
+    as recently used; once max_sessions is exceeded the least recently used
+    session is evicted, and sessions idle for longer than ttl_seconds are
+    dropped on access or by the background sweeper.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        ttl_seconds: float = 3600,
+        sweep_interval: float = 60,
+        sizeof: Callable[[Any], int] = estimate_session_bytes,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            max_sessions: Maximum number of live sessions (0 = unlimited)
+            ttl_seconds: Idle time after which a session expires (0 = never)
+            sweep_interval: Seconds between background sweeps
+            sizeof: Function estimating the bytes held by one session
+            clock: Monotonic time source (overridable for tests)
+        """
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+        self._sizeof = sizeof
+        self._clock = clock
+
+        # session_id -> (session, last_access); ordered oldest access first
+        self._sessions: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._evicted = 0
+        self._expired = 0
+
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop_sweeper = threading.Event()
+
+    def _is_expired(self, last_access: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - last_access > self.ttl_seconds
+
+    def _expire_if_idle(self, session_id: str, now: float) -> bool:
+        """Drop the session if it has expired. Caller holds the lock."""
+        entry = self._sessions.get(session_id)
+        if entry is not None and self._is_expired(entry[1], now):
+            del self._sessions[session_id]
+            self._expired += 1
+            return True
+        return False
+
+    def __contains__(self, session_id: object) -> bool:
+        with self._lock:
+            if not isinstance(session_id, str):
+                return False
+            self._expire_if_idle(session_id, self._clock())
+            return session_id in self._sessions
+
+    def __getitem__(self, session_id: str) -> Any:
+        with self._lock:
+            now = self._clock()
+            if self._expire_if_idle(session_id, now) or session_id not in self._sessions:
+                raise KeyError(session_id)
+            session, _ = self._sessions[session_id]
+            self._sessions[session_id] = (session, now)
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def __setitem__(self, session_id: str, session: Any) -> None:
+        with self._lock:
+            self._sessions[session_id] = (session, self._clock())
+            self._sessions.move_to_end(session_id)
+            while self.max_sessions and len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._evicted += 1
+
+    def __delitem__(self, session_id: str) -> None:
+        with self._lock:
+            del self._sessions[session_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        """Return the session (marking it as used) or default."""
+        try:
+            return self[session_id]
+        except KeyError:
+            return default
+
+    def pop(self, session_id: str, default: Any = None) -> Any:
+        """Remove and return the session, or default if it doesn't exist."""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            return default if entry is None else entry[0]
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """Return a snapshot of (session_id, session) pairs without touching them."""
+        with self._lock:
+            return [(sid, session) for sid, (session, _) in self._sessions.items()]
+
+    def sweep(self) -> int:
+        """
+        Remove all expired sessions.
+
+        Returns:
+            Number of sessions removed
+        """
+        if self.ttl_seconds <= 0:
+            return 0
+
+        removed = 0
+        with self._lock:
+            now = self._clock()
+            # Oldest access first, so stop at the first live session
+            while self._sessions:
+                session_id, (_, last_access) = next(iter(self._sessions.items()))
+                if not self._is_expired(last_access, now):
+                    break
+                del self._sessions[session_id]
+                removed += 1
+            self._expired += removed
+        return removed
+
+    def start_sweeper(self) -> None:
+        """Start the background thread that periodically calls sweep()."""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+
+        self._stop_sweeper.clear()
+
+        def run():
+            while not self._stop_sweeper.wait(self.sweep_interval):
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        """Stop the background sweeper thread."""
+        self._stop_sweeper.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=self.sweep_interval + 1)
+            self._sweeper = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report store occupancy and approximate memory usage.
+
+        Returns:
+            Dictionary of counters suitable for a health endpoint
+        """
+        sessions = [session for _, session in self.items()]
+        total_bytes = sum(self._sizeof(session) for session in sessions)
+
+        return {
+            "sessions": len(sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "approx_bytes": total_bytes,
+            "avg_session_bytes": total_bytes // len(sessions) if sessions else 0,
+            "evicted": self._evicted,
+            "expired": self._expired,
+        }
+
+
+def _to_message(role: str, content: str) -> BaseMessage:
+    return HumanMessage(content=content) if role == "human" else AIMessage(content=content)
+
+
+class HistoryBackend:
+    """
+    Interface for persistent chat history storage.
+
+    Backends store every message of every session plus its creation time.
+    They may buffer writes, but reads must reflect all earlier writes made
+    through the same backend instance.
+    """
+
+    def create_session(self, session_id: str, created_at: str) -> None:
+        """Register a session (no-op if it already exists)."""
+        raise NotImplementedError
+
+    def get_created_at(self, session_id: str) -> Optional[str]:
+        """Return the session's creation time, or None if it doesn't exist."""
+        raise NotImplementedError
+
+    def message_count(self, session_id: str) -> int:
+        """Return the total number of stored messages for the session."""
+        raise NotImplementedError
+
+    def load(self, session_id: str, limit: Optional[int] = None) -> List[BaseMessage]:
+        """Return the session's messages (the last `limit` if given), oldest first."""
+        raise NotImplementedError
+
+    def iter_messages(self, session_id: str, page_size: int = 500) -> Iterator[BaseMessage]:
+        """Yield every message of the session, oldest first, without loading them all at once."""
+        yield from self.load(session_id)
+
+    def append(self, session_id: str, messages: List[BaseMessage]) -> None:
+        """Append messages to the session."""
+        raise NotImplementedError
+
+    def clear(self, session_id: str) -> None:
+        """Remove all messages from the session but keep the session."""
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        """Remove the session and its messages."""
+        raise NotImplementedError
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        """Return session_id, created_at and message_count for every session."""
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Block until all buffered writes are durable."""
+
+    def close(self) -> None:
+        """Flush and release resources."""
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """
+    SQLite history backend with write-behind batching.
+
+    The database runs in WAL mode so several processes (e.g. uvicorn
+    workers) can read concurrently while one writes. Writes are queued and
+    applied by a background thread in batches of up to batch_size
+    operations per transaction, each in its own savepoint so one bad
+    operation doesn't roll back the rest. Reads never wait for the writer:
+    writes still queued are applied to the query result from memory. Each
+    backend records the sequence number of its last committed write in the
+    same transaction, so a read knows which queued writes its snapshot
+    already contains.
+
+    Deleting a session leaves a tombstone, so a late append from a worker
+    that still has the session open doesn't bring it back; creating the
+    session again removes the tombstone.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+        CREATE TABLE IF NOT EXISTS deleted_sessions (
+            session_id TEXT PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS writer_state (
+            writer_id TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str = "sessions.db", batch_size: int = 100, flush_interval: float = 0.05):
+        """
+        Open (and create if needed) the database and start the writer thread.
+
+        Args:
+            db_path: Path to the SQLite database file
+            batch_size: Maximum queued operations applied per transaction
+            flush_interval: Seconds the writer waits to fill a batch
+        """
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+
+        self._writer_id = uuid.uuid4().hex
+        self._local = threading.local()
+        self._queue: "queue.Queue" = queue.Queue()
+        # session_id -> [(seq, op)] queued but not yet committed
+        self._pending: Dict[str, List[Tuple[int, Tuple]]] = {}
+        self._pending_lock = threading.Lock()
+        self._seq = 0
+        self._closed = False
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(self._SCHEMA)
+
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's read connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # Write-behind queue
+
+    def _enqueue(self, session_id: str, op: Tuple) -> None:
+        if self._closed:
+            raise RuntimeError("History backend is closed")
+        with self._pending_lock:
+            self._seq += 1
+            self._pending.setdefault(session_id, []).append((self._seq, op))
+            self._queue.put((self._seq, op))
+
+    def _read(self, session_id: str, query: Callable[[sqlite3.Connection], Any]) -> Tuple[Any, List[Tuple]]:
+        """
+        Run a query on a consistent snapshot.
+
+        Returns:
+            (query result, this session's queued ops the snapshot doesn't contain)
+        """
+        with self._pending_lock:
+            pending = list(self._pending.get(session_id, ()))
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                "SELECT seq FROM writer_state WHERE writer_id = ?", (self._writer_id,)
+            ).fetchone()
+            result = query(conn)
+        finally:
+            conn.execute("COMMIT")
+        committed = row[0] if row else 0
+        return result, [op for seq, op in pending if seq > committed]
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            # Fill the batch until it's full, the interval passes or a flush is requested
+            while len(batch) < self.batch_size and batch[-1][0] not in ("flush", "stop"):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            ops = [item for item in batch if item[0] not in ("flush", "stop")]
+            if ops:
+                self._commit(conn, ops)
+                last_seq = ops[-1][0]
+                with self._pending_lock:
+                    for session_id in {op[1] for _, op in ops}:
+                        remaining = [entry for entry in self._pending.get(session_id, ()) if entry[0] > last_seq]
+                        if remaining:
+                            self._pending[session_id] = remaining
+                        else:
+                            self._pending.pop(session_id, None)
+
+            for item in batch:
+                if item[0] in ("flush", "stop"):
+                    item[1].set()
+            if batch[-1][0] == "stop":
+                conn.close()
+                return
+
+    def _commit(self, conn: sqlite3.Connection, ops: List[Tuple[int, Tuple]]) -> None:
+        """Apply a batch in one transaction, rolling back only the ops that fail."""
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for seq, op in ops:
+                conn.execute("SAVEPOINT op")
+                try:
+                    self._apply(conn, op)
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO op")
+                    logger.error("Error writing chat history (%s %s): %s", op[0], op[1], e)
+                conn.execute("RELEASE op")
+            conn.execute(
+                "INSERT OR REPLACE INTO writer_state (writer_id, seq) VALUES (?, ?)",
+                (self._writer_id, ops[-1][0])
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error("Error writing chat history (%d operations lost): %s", len(ops), e)
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, op: Tuple) -> None:
+        kind = op[0]
+        if kind == "create":
+            _, session_id, created_at = op
+            conn.execute("DELETE FROM deleted_sessions WHERE session_id = ?", (session_id,))
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, created_at) VALUES (?, ?)",
+                (session_id, created_at)
+            )
+        elif kind == "append":
+            _, session_id, rows = op
+            if conn.execute("SELECT 1 FROM deleted_sessions WHERE session_id = ?", (session_id,)).fetchone():
+                # Deleted (possibly by another worker) since this bot loaded it
+                return
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, created_at) VALUES (?, ?)",
+                (session_id, str(uuid.uuid1().time))
+            )
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                [(session_id, role, content) for role, content in rows]
+            )
+            conn.execute(
+                "UPDATE sessions SET message_count = message_count + ? WHERE session_id = ?",
+                (len(rows), session_id)
+            )
+        elif kind == "clear":
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (op[1],))
+            conn.execute("UPDATE sessions SET message_count = 0 WHERE session_id = ?", (op[1],))
+        elif kind == "delete":
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (op[1],))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (op[1],))
+            conn.execute("INSERT OR IGNORE INTO deleted_sessions (session_id) VALUES (?)", (op[1],))
+
+    # HistoryBackend interface
+
+    def create_session(self, session_id: str, created_at: str) -> None:
+        self._enqueue(session_id, ("create", session_id, created_at))
+
+    def get_created_at(self, session_id: str) -> Optional[str]:
+        row, pending = self._read(session_id, lambda conn: conn.execute(
+            "SELECT created_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone())
+        created_at = row[0] if row else None
+        for op in pending:
+            if op[0] == "create" and created_at is None:
+                created_at = op[2]
+            elif op[0] == "delete":
+                created_at = None
+        return created_at
+
+    def message_count(self, session_id: str) -> int:
+        row, pending = self._read(session_id, lambda conn: conn.execute(
+            "SELECT message_count FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone())
+        count = row[0] if row else 0
+        for op in pending:
+            count = count + len(op[2]) if op[0] == "append" else 0 if op[0] in ("clear", "delete") else count
+        return count
+
+    def load(self, session_id: str, limit: Optional[int] = None) -> List[BaseMessage]:
+        # Queued writes only add at the end, so the last `limit` rows are enough
+        db_rows, pending = self._read(session_id, lambda conn: conn.execute(
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, -1 if limit is None else limit)
+        ).fetchall())
+        rows = list(reversed(db_rows))
+        for op in pending:
+            if op[0] == "append":
+                rows.extend(op[2])
+            elif op[0] in ("clear", "delete"):
+                rows = []
+        if limit is not None:
+            rows = rows[-limit:] if limit else []
+        return [_to_message(role, content) for role, content in rows]
+
+    def iter_messages(self, session_id: str, page_size: int = 500) -> Iterator[BaseMessage]:
+        # Page through the rows committed when the export started (by id, so
+        # each page is an index range scan), then the writes still queued then
+        last_id, pending = self._read(session_id, lambda conn: conn.execute(
+            "SELECT MAX(id) FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()[0])
+        tail: List[Tuple[str, str]] = []
+        for op in pending:
+            if op[0] == "append":
+                tail.extend(op[2])
+            elif op[0] in ("clear", "delete"):
+                tail, last_id = [], None
+
+        after = 0
+        while last_id is not None and after < last_id:
+            rows = self._connection().execute(
+                "SELECT id, role, content FROM messages "
+                "WHERE session_id = ? AND id > ? AND id <= ? ORDER BY id LIMIT ?",
+                (session_id, after, last_id, page_size)
+            ).fetchall()
+            if not rows:
+                break
+            for _, role, content in rows:
+                yield _to_message(role, content)
+            after = rows[-1][0]
+
+        for role, content in tail:
+            yield _to_message(role, content)
+
+    def append(self, session_id: str, messages: List[BaseMessage]) -> None:
+        rows = [(msg.type, msg.content) for msg in messages]
+        self._enqueue(session_id, ("append", session_id, rows))
+
+    def clear(self, session_id: str) -> None:
+        self._enqueue(session_id, ("clear", session_id))
+
+    def delete(self, session_id: str) -> None:
+        self._enqueue(session_id, ("delete", session_id))
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        self.flush()
+        rows = self._connection().execute(
+            "SELECT session_id, created_at, message_count FROM sessions ORDER BY created_at"
+        ).fetchall()
+        return [
+            {"session_id": sid, "created_at": created_at, "message_count": count}
+            for sid, created_at, count in rows
+        ]
+
+    def flush(self) -> None:
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        done.wait()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        done = threading.Event()
+        self._queue.put(("stop", done))
+        done.wait()
+        self._writer.join()
+
+
+def create_history_backend(name: str, db_path: str = "sessions.db", **kwargs: Any) -> Optional[HistoryBackend]:
+    """
+    Create the history backend selected in configuration.
+
+    Args:
+        name: "memory" (history lives only on each ChatBot) or "sqlite"
+        db_path: Database path for the sqlite backend
+        **kwargs: Extra backend options (e.g. batch_size)
+
+    Returns:
+        A backend instance, or None for in-memory history
+    """
+    name = name.lower()
+    if name == "memory":
+        return None
+    if name == "sqlite":
+        return SQLiteHistoryBackend(db_path, **kwargs)
+    raise ValueError(f"Unknown session backend: {name}")
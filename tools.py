@@ -1,13 +1,27 @@
-from langchain_community.tools import WikipediaQueryRun, DuckDuckGoSearchRun
-from langchain_community.utilities import WikipediaAPIWrapper
-from langchain.tools import Tool
+from langchain_core.tools import Tool
 from datetime import datetime
-import os
+from cache import SingleFlight, ToolCache, SQLiteCacheStore
+from file_writer import BackgroundFileWriter
+from http_tools import AsyncHTTPClient, AsyncWebSearch, AsyncWikipedia
+from config import settings
+from typing import Any, Callable
+import importlib.util
+import threading
+
+# Writes SaveToFile output off the request path
+file_writer = BackgroundFileWriter(
+    batch_size=settings.SAVE_BATCH_SIZE,
+    fsync=settings.SAVE_FSYNC
+)
+
 
 def save_to_txt(data: str, filename: str = "research_output.txt") -> str:
     """
     Save research data to a text file.
     
+    The file is written by the background file writer; the returned path
+    is final (timestamp-prefixed, never overwriting another save).
+    
     Args:
         data: The content to save
         filename: Output filename (default: research_output.txt)
@@ -16,52 +30,168 @@ def save_to_txt(data: str, filename: str = "research_output.txt") -> str:
         Success message with file path
     """
     try:
-        output_dir = "outputs"
-        os.makedirs(output_dir, exist_ok=True)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename_with_timestamp = f"{timestamp}_{filename}"
-        filepath = os.path.join(output_dir, filename_with_timestamp)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(data)
-        
+        filepath = file_writer.submit(settings.OUTPUT_DIR, filename, data)
         return f"Successfully saved to {filepath}"
     except Exception as e:
         return f"Error saving file: {str(e)}"
 
 
-def get_current_time() -> str:
+def get_current_time(query: str = "") -> str:
     """
     Get the current date and time.
     
+    Args:
+        query: Ignored; the agent always passes a tool input string
+    
     Returns:
         Formatted current datetime string
     """
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 
-# Initialize Wikipedia tool
-wikipedia = WikipediaQueryRun(
-    api_wrapper=WikipediaAPIWrapper(
-        top_k_results=2,
-        doc_content_chars_max=1000
+def _lazy(factory: Callable[[], Any]) -> Callable[[], Any]:
+    """
+    Return a getter that builds a value on first call and then reuses it.
+    
+    Used for the network tool wrappers: langchain_community and the client
+    libraries behind them are slow to import, so they're only loaded once a
+    tool actually runs (or warm_tools is called).
+    """
+    lock = threading.Lock()
+    built = []
+    
+    def get():
+        if not built:
+            with lock:
+                if not built:
+                    built.append(factory())
+        return built[0]
+    
+    return get
+
+
+@_lazy
+def get_wikipedia():
+    """The Wikipedia search tool, built on first use."""
+    from langchain_community.tools import WikipediaQueryRun
+    from langchain_community.utilities import WikipediaAPIWrapper
+    return WikipediaQueryRun(
+        api_wrapper=WikipediaAPIWrapper(
+            top_k_results=settings.WIKI_TOP_K,
+            doc_content_chars_max=settings.WIKI_MAX_CHARS
+        )
+    )
+
+
+@_lazy
+def get_local_wikipedia():
+    """The offline Wikipedia index (WIKI_BACKEND=local), opened on first use."""
+    from local_wiki import LocalWikipedia
+    return LocalWikipedia(
+        settings.LOCAL_WIKI_PATH,
+        top_k_results=settings.WIKI_TOP_K,
+        max_chars=settings.WIKI_MAX_CHARS
     )
+
+
+@_lazy
+def get_search():
+    """The DuckDuckGo search tool, built on first use."""
+    from langchain_community.tools import DuckDuckGoSearchRun
+    return DuckDuckGoSearchRun()
+
+
+use_local_wikipedia = settings.WIKI_BACKEND == "local"
+
+
+def search_wikipedia(query: str) -> str:
+    """Search Wikipedia (uncached)."""
+    if use_local_wikipedia:
+        return get_local_wikipedia().run(query)
+    return get_wikipedia().run(query)
+
+
+def search_web(query: str) -> str:
+    """Search the web with DuckDuckGo (uncached)."""
+    return get_search().run(query)
+
+
+# Keep-alive connection pool shared by the async tool implementations
+http_client = AsyncHTTPClient(
+    pool_size=settings.HTTP_POOL_SIZE,
+    pool_size_per_host=settings.HTTP_POOL_SIZE_PER_HOST,
+    dns_cache_ttl=settings.HTTP_DNS_CACHE_TTL,
+    timeout=settings.HTTP_TIMEOUT_SECONDS,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT_SECONDS
+)
+
+async_wikipedia = AsyncWikipedia(
+    http_client,
+    api_url=settings.WIKIPEDIA_API_URL,
+    top_k_results=settings.WIKI_TOP_K,
+    max_chars=settings.WIKI_MAX_CHARS
+)
+
+async_search = AsyncWebSearch(http_client, url=settings.DUCKDUCKGO_HTML_URL)
+
+# Without aiohttp, async runs call the sync wrappers in worker threads
+use_async_http = settings.ASYNC_HTTP_TOOLS and importlib.util.find_spec("aiohttp") is not None
+
+
+def warm_tools() -> None:
+    """Import and build the lazy tool wrappers ahead of the first request."""
+    if use_local_wikipedia:
+        get_local_wikipedia()
+    else:
+        get_wikipedia()
+    get_search()
+
+
+# Coalesces concurrent identical upstream calls across all sessions
+tool_flight = SingleFlight()
+
+# Cache for network-backed tool results, shared by all sessions
+tool_cache = ToolCache(
+    ttls={
+        "Wikipedia": settings.TOOL_CACHE_TTL_WIKIPEDIA,
+        "WebSearch": settings.TOOL_CACHE_TTL_WEBSEARCH,
+    },
+    max_entries=settings.TOOL_CACHE_MAX_ENTRIES,
+    disk=SQLiteCacheStore(settings.TOOL_CACHE_PATH) if settings.TOOL_CACHE_PATH else None,
+    flight=tool_flight
 )
 
-# Initialize DuckDuckGo search tool
-search = DuckDuckGoSearchRun()
+
+def _cached(tool_name: str, func):
+    """Wrap a tool function with the shared cache (or just coalescing if caching is off)."""
+    if settings.TOOL_CACHE_ENABLED:
+        return tool_cache.wrap(tool_name, func)
+    return tool_flight.wrap(tool_name, func)
+
+
+def _acached(tool_name: str, func):
+    """Async counterpart of _cached for the tool's coroutine."""
+    if settings.TOOL_CACHE_ENABLED:
+        return tool_cache.awrap(tool_name, func)
+    return tool_flight.awrap(tool_name, func)
+
 
 # Create custom tools
 wiki_tool = Tool(
     name="Wikipedia",
-    func=wikipedia.run,
+    func=_cached("Wikipedia", search_wikipedia),
+    # The local index is queried in a worker thread; it answers in milliseconds
+    coroutine=_acached(
+        "Wikipedia",
+        async_wikipedia.run if use_async_http and not use_local_wikipedia else search_wikipedia
+    ),
     description="Useful for searching Wikipedia for detailed information about topics, people, places, and events. Input should be a search query."
 )
 
 search_tool = Tool(
     name="WebSearch",
-    func=search.run,
+    func=_cached("WebSearch", search_web),
+    coroutine=_acached("WebSearch", async_search.run if use_async_http else search_web),
     description="Useful for searching the web for current information, news, and general queries. Input should be a search query."
 )
 
@@ -0,0 +1,354 @@
+"""
+Structured tracing of chat turns.
+
+A TraceRecorder is a callback handler attached to one turn; it records a
+span for the turn and for every LLM and tool call in it (name, duration,
+tokens, status). Finished traces go into a per-session ring buffer
+(served at /session/{id}/trace) and, for a sampled fraction of turns, to
+a JSONL file written by a background thread, so recording never blocks
+on I/O.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Tool inputs/outputs are truncated to this many characters in spans
+MAX_TEXT_CHARS = 200
+
+
+def _truncate(value: Any) -> str:
+    text = str(value)
+    return text if len(text) <= MAX_TEXT_CHARS else text[:MAX_TEXT_CHARS] + "..."
+
+
+class JSONLTraceSink:
+    """
+    Appends spans to a JSONL file from a background thread.
+
+    submit() never blocks: when the queue is full the spans are dropped
+    and counted instead.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_queue: int = 10_000,
+        batch_size: int = 256,
+        flush_interval: float = 0.5
+    ):
+        """
+        Start the writer thread.
+
+        Args:
+            path: JSONL file to append to (its directory is created)
+            max_queue: Maximum traces waiting to be written
+            batch_size: Maximum traces written per batch
+            flush_interval: Seconds the writer waits to fill a batch
+        """
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        # Control ops bypass the bounded data queue so they never get dropped
+        self._control: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {"written": 0, "dropped": 0, "failed": 0}
+        self._closed = False
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+        self._writer.start()
+
+    def submit(self, spans: List[Dict[str, Any]]) -> bool:
+        """Queue one trace's spans; returns False if they were dropped."""
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(spans)
+            return True
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += len(spans)
+            return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every trace submitted so far is written."""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._control.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Write everything still queued and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        done = threading.Event()
+        self._control.put(("stop", done))
+        done.wait()
+        self._writer.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Spans written, dropped and failed, and traces still queued."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+    def _drain(self) -> List[List[Dict[str, Any]]]:
+        traces = []
+        while len(traces) < self.batch_size:
+            try:
+                traces.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return traces
+
+    def _write_loop(self) -> None:
+        while True:
+            try:
+                op = self._control.get(timeout=self.flush_interval)
+            except queue.Empty:
+                op = None
+
+            # Write until the data queue is empty, so a flush covers all earlier submits
+            while True:
+                traces = self._drain()
+                if not traces:
+                    break
+                self._write(traces)
+
+            if op is not None:
+                op[1].set()
+                if op[0] == "stop":
+                    return
+
+    def _write(self, traces: List[List[Dict[str, Any]]]) -> None:
+        lines = [json.dumps(span, ensure_ascii=False) for spans in traces for span in spans]
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            with self._lock:
+                self._stats["written"] += len(lines)
+        except OSError as e:
+            with self._lock:
+                self._stats["failed"] += len(lines)
+            logger.error("Error writing traces to %s: %s", self.path, e)
+
+
+class TraceStore:
+    """
+    Recent spans per session, in bounded ring buffers.
+
+    Holds at most max_spans spans for each of the max_sessions most
+    recently traced sessions, and forwards a sample of traces to the sink.
+    """
+
+    def __init__(
+        self,
+        max_spans: int = 256,
+        max_sessions: int = 1000,
+        sink: Optional[JSONLTraceSink] = None,
+        sample_rate: float = 1.0
+    ):
+        """
+        Args:
+            max_spans: Spans kept per session (oldest dropped first)
+            max_sessions: Sessions kept (least recently traced dropped first)
+            sink: Optional JSONL sink for sampled traces
+            sample_rate: Fraction of traces sent to the sink (0.0-1.0)
+        """
+        self.max_spans = max_spans
+        self.max_sessions = max_sessions
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self._buffers: "OrderedDict[str, Deque[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._traces = 0
+        self._sampled = 0
+
+    def recorder(self, session_id: Optional[str], method: str) -> "TraceRecorder":
+        """Create the recorder for one turn of a session."""
+        return TraceRecorder(self, session_id or "default", method)
+
+    def add(self, session_id: str, spans: List[Dict[str, Any]]) -> None:
+        """Store a finished trace and send it to the sink if it's sampled."""
+        with self._lock:
+            buffer = self._buffers.get(session_id)
+            if buffer is None:
+                buffer = self._buffers[session_id] = deque(maxlen=self.max_spans)
+                if len(self._buffers) > self.max_sessions:
+                    self._buffers.popitem(last=False)
+            else:
+                self._buffers.move_to_end(session_id)
+            buffer.extend(spans)
+            self._traces += 1
+            sampled = self.sink is not None and random.random() < self.sample_rate
+            if sampled:
+                self._sampled += 1
+        if sampled:
+            self.sink.submit(spans)
+
+    def get(self, session_id: str) -> List[Dict[str, Any]]:
+        """Recorded spans of a session, oldest first."""
+        with self._lock:
+            return list(self._buffers.get(session_id, ()))
+
+    def clear(self, session_id: str) -> None:
+        """Forget a session's spans."""
+        with self._lock:
+            self._buffers.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Traced turns, sampled turns, sessions held and sink stats."""
+        with self._lock:
+            stats = {
+                "traces": self._traces,
+                "sampled": self._sampled,
+                "sessions": len(self._buffers),
+                "sample_rate": self.sample_rate,
+            }
+        if self.sink is not None:
+            stats["sink"] = self.sink.stats()
+        return stats
+
+    def close(self) -> None:
+        """Flush and stop the sink."""
+        if self.sink is not None:
+            self.sink.close()
+
+
+class TraceRecorder(BaseCallbackHandler):
+    """
+    Callback handler recording the spans of one chat turn.
+
+    Use as a context manager around the turn (the turn span) and pass it in
+    the agent's callbacks (LLM and tool spans, parented to the turn).
+    """
+
+    # Only bookkeeping; safe to run on the event loop
+    run_inline = True
+
+    def __init__(self, store: TraceStore, session_id: str, method: str):
+        """
+        Args:
+            store: Where the finished trace goes
+            session_id: Session the turn belongs to
+            method: Turn type ("chat", "achat", "stream")
+        """
+        self.store = store
+        self.session_id = session_id
+        self.trace_id = uuid.uuid4().hex
+        self.turn: Dict[str, Any] = self._span("turn", method, None)
+        self.spans: List[Dict[str, Any]] = []
+        self._open: Dict[Any, tuple] = {}
+
+    def _span(self, kind: str, name: str, parent_id: Optional[str]) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent_id,
+            "session_id": self.session_id,
+            "kind": kind,
+            "name": name,
+            "start": round(time.time(), 3),
+            "duration_ms": None,
+            "status": "ok",
+        }
+
+    def __enter__(self) -> "TraceRecorder":
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.record_error(exc)
+        self.turn["duration_ms"] = round((time.perf_counter() - self._started_at) * 1000, 2)
+        self.store.add(self.session_id, [self.turn] + self.spans)
+        return False
+
+    def set(self, **attributes: Any) -> None:
+        """Add attributes to the turn span (e.g. fast_path, cached)."""
+        self.turn.update(attributes)
+
+    def record_error(self, error: BaseException) -> None:
+        """Mark the turn as failed."""
+        self.turn["status"] = "error"
+        self.turn["error"] = f"{type(error).__name__}: {_truncate(error)}"
+
+    def _start(self, run_id, kind: str, name: str, **attributes: Any) -> None:
+        span = self._span(kind, name, self.turn["span_id"])
+        span.update(attributes)
+        self.spans.append(span)
+        self._open[run_id] = (span, time.perf_counter())
+
+    def _end(self, run_id, error: Optional[BaseException] = None, **attributes: Any) -> None:
+        opened = self._open.pop(run_id, None)
+        if opened is None:
+            return
+        span, started = opened
+        span["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        span.update(attributes)
+        if error is not None:
+            span["status"] = "error"
+            span["error"] = f"{type(error).__name__}: {_truncate(error)}"
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or params.get("_type") or "unknown"
+        self._start(run_id, "llm", model, messages=sum(len(batch) for batch in messages))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        opened = self._open.get(run_id)
+        if opened is not None and "first_token_ms" not in opened[0]:
+            opened[0]["first_token_ms"] = round((time.perf_counter() - opened[1]) * 1000, 2)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage: Dict[str, Any] = {}
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    usage = {
+                        "input_tokens": metadata.get("input_tokens", 0),
+                        "output_tokens": metadata.get("output_tokens", 0),
+                        "cached_tokens": (metadata.get("input_token_details") or {}).get("cache_read", 0) or 0,
+                    }
+        self._end(run_id, **usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "unknown"
+        self._start(run_id, "tool", name, input=_truncate(input_str))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, output_chars=len(str(getattr(output, "content", output))))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+# Shared by every bot in this process
+trace_store = TraceStore(
+    max_spans=settings.TRACE_BUFFER_SPANS,
+    max_sessions=settings.MAX_SESSIONS,
+    sink=JSONLTraceSink(settings.TRACE_SINK_PATH) if settings.TRACE_SINK_PATH else None,
+    sample_rate=settings.TRACE_SAMPLE_RATE
+)
@@ -2,10 +2,13 @@
 Utility functions for the LangChain chatbot.
 """
 import os
+import heapq
 import json
+import threading
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from pathlib import Path
+from archive import ConversationArchive, INDEX_FILE
 
 
 def ensure_directory(directory: str) -> None:
@@ -43,21 +46,141 @@ def save_conversation(
     filepath = os.path.join(output_dir, filename)
     
     with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(conversation, f, indent=2, ensure_ascii=False)
+        f.writelines(iter_json(conversation))
     
     return filepath
 
 
+def iter_markdown(
+    conversation: Iterable[Dict[str, str]],
+    title: str = "Conversation Export"
+) -> Iterator[str]:
+    """
+    Render a conversation as Markdown, one chunk per message.
+    
+    Args:
+        conversation: Message dictionaries with 'role' and 'content'
+        title: Title for the markdown document
+        
+    Yields:
+        Markdown text chunks
+    """
+    yield (
+        f"# {title}\n\n"
+        f"*Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*\n\n"
+        "---\n\n"
+    )
+    for msg in conversation:
+        role = msg.get('role', 'unknown').title()
+        content = msg.get('content', '')
+        yield f"## {role}\n\n{content}\n\n"
+
+
+def iter_json(conversation: Iterable[Dict[str, str]]) -> Iterator[str]:
+    """
+    Render a conversation as an indented JSON array, one chunk per message.
+    
+    The output is identical to json.dump(conversation, indent=2,
+    ensure_ascii=False) without holding the whole document in memory.
+    
+    Args:
+        conversation: Message dictionaries with 'role' and 'content'
+        
+    Yields:
+        JSON text chunks
+    """
+    empty = True
+    for msg in conversation:
+        encoded = json.dumps(msg, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+        yield ("[\n  " if empty else ",\n  ") + encoded
+        empty = False
+    yield "[]" if empty else "\n]"
+
+
+def iter_jsonl(conversation: Iterable[Dict[str, str]]) -> Iterator[str]:
+    """
+    Render a conversation as JSON Lines, one message per line.
+    
+    Args:
+        conversation: Message dictionaries with 'role' and 'content'
+        
+    Yields:
+        One JSON line per message
+    """
+    for msg in conversation:
+        yield json.dumps(msg, ensure_ascii=False) + "\n"
+
+
+# Streaming exporters by format name: (renderer, media type, file extension)
+EXPORT_FORMATS = {
+    "markdown": (iter_markdown, "text/markdown; charset=utf-8", ".md"),
+    "json": (iter_json, "application/json", ".json"),
+    "jsonl": (iter_jsonl, "application/x-ndjson", ".jsonl"),
+}
+
+
+# Open archives by directory, so the offset index is read once per process
+_archives: Dict[str, ConversationArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(archive_dir: str, compression: Optional[str] = None) -> ConversationArchive:
+    """
+    Return the shared ConversationArchive for a directory.
+    
+    Args:
+        archive_dir: Archive directory
+        compression: Compression for new segments (None, "gzip" or "zstd");
+            only used when the archive is first opened in this process
+        
+    Returns:
+        The open archive
+    """
+    key = os.path.abspath(archive_dir)
+    with _archives_lock:
+        if key not in _archives:
+            _archives[key] = ConversationArchive(archive_dir, compression=compression)
+        return _archives[key]
+
+
+def save_to_archive(
+    conversation: List[Dict[str, str]],
+    archive_dir: str = os.path.join("outputs", "archive"),
+    conversation_id: Optional[str] = None,
+    compression: Optional[str] = None
+) -> str:
+    """
+    Append a conversation to the segmented archive.
+    
+    Args:
+        conversation: List of message dictionaries with 'role' and 'content'
+        archive_dir: Archive directory
+        conversation_id: Optional id (generated if omitted)
+        compression: Compression for new segments (None, "gzip" or "zstd")
+        
+    Returns:
+        Reference "<archive_dir>#<conversation_id>" accepted by load_conversation
+    """
+    conversation_id = get_archive(archive_dir, compression).append(conversation, conversation_id)
+    return f"{archive_dir}#{conversation_id}"
+
+
 def load_conversation(filepath: str) -> List[Dict[str, str]]:
     """
-    Load a conversation from a JSON file.
+    Load a conversation from a JSON file or the archive.
     
     Args:
-        filepath: Path to the conversation file
+        filepath: Path to the conversation file, or an archive reference
+            "<archive_dir>#<conversation_id>" from save_to_archive
         
     Returns:
         List of message dictionaries
     """
+    if not os.path.isfile(filepath) and "#" in filepath:
+        archive_dir, _, conversation_id = filepath.rpartition("#")
+        if os.path.isfile(os.path.join(archive_dir, INDEX_FILE)):
+            return get_archive(archive_dir).load(conversation_id)
+    
     with open(filepath, 'r', encoding='utf-8') as f:
         return json.load(f)
 
@@ -128,18 +251,16 @@ def validate_api_key(api_key: Optional[str]) -> bool:
     return isinstance(api_key, str) and len(api_key.strip()) > 0
 
 
-def get_file_size(filepath: str) -> str:
+def format_file_size(size_bytes: float) -> str:
     """
-    Get human-readable file size.
+    Format a byte count as a human-readable size.
     
     Args:
-        filepath: Path to the file
+        size_bytes: Size in bytes
         
     Returns:
         Formatted file size string
     """
-    size_bytes = os.path.getsize(filepath)
-    
     for unit in ['B', 'KB', 'MB', 'GB']:
         if size_bytes < 1024:
             return f"{size_bytes:.2f} {unit}"
@@ -148,60 +269,150 @@ def get_file_size(filepath: str) -> str:
     return f"{size_bytes:.2f} TB"
 
 
-def list_saved_conversations(output_dir: str = "outputs") -> List[Dict[str, Any]]:
+def get_file_size(filepath: str) -> str:
+    """
+    Get human-readable file size.
+    
+    Args:
+        filepath: Path to the file
+        
+    Returns:
+        Formatted file size string
+    """
+    return format_file_size(os.path.getsize(filepath))
+
+
+def _scan_files(directory: str, suffix: str = "") -> Iterator[Tuple[os.DirEntry, os.stat_result]]:
     """
-    List all saved conversation files.
+    Yield (entry, stat) for regular files in a directory, one stat each.
+    
+    Entries that vanish while scanning are skipped.
+    """
+    try:
+        scanner = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    with scanner:
+        for entry in scanner:
+            if suffix and not entry.name.endswith(suffix):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                yield entry, entry.stat()
+            except FileNotFoundError:
+                continue
+
+
+def list_saved_conversations(
+    output_dir: str = "outputs",
+    limit: Optional[int] = None,
+    offset: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    List saved conversation files, newest first.
+    
+    With a limit only the newest offset + limit files are kept while
+    scanning, so a page of a huge directory costs one pass and little
+    memory.
     
     Args:
         output_dir: Directory to search for conversation files
+        limit: Maximum number of files to return (None = all)
+        offset: Number of newest files to skip (for pagination)
         
     Returns:
         List of dictionaries with file information
     """
-    if not os.path.exists(output_dir):
-        return []
+    files = (
+        (stat.st_mtime, entry.name, entry.path, stat.st_size)
+        for entry, stat in _scan_files(output_dir, '.json')
+    )
+    if limit is None:
+        newest = sorted(files, reverse=True)
+    else:
+        newest = heapq.nlargest(offset + limit, files)
     
-    conversations = []
-    for filename in os.listdir(output_dir):
-        if filename.endswith('.json'):
-            filepath = os.path.join(output_dir, filename)
-            conversations.append({
-                'filename': filename,
-                'filepath': filepath,
-                'size': get_file_size(filepath),
-                'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S')
-            })
+    return [
+        {
+            'filename': filename,
+            'filepath': filepath,
+            'size': format_file_size(size),
+            'modified': datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+        }
+        for mtime, filename, filepath, size in newest[offset:]
+    ]
+
+
+def iter_clean_old_files(
+    output_dir: str = "outputs",
+    days_old: int = 30,
+    batch_size: int = 500,
+    max_files: Optional[int] = None
+) -> Iterator[List[str]]:
+    """
+    Delete old files incrementally, one bounded batch at a time.
     
-    return sorted(conversations, key=lambda x: x['modified'], reverse=True)
+    The directory is scanned lazily; each yielded batch has been deleted
+    already, so a caller can pause, report progress or stop between
+    batches.
+    
+    Args:
+        output_dir: Directory to clean
+        days_old: Remove files older than this many days
+        batch_size: Maximum files deleted per batch
+        max_files: Stop after deleting this many files (None = no limit)
+        
+    Yields:
+        Paths removed in each batch
+    """
+    cutoff_time = datetime.now().timestamp() - (days_old * 24 * 60 * 60)
+    remaining = max_files
+    batch: List[str] = []
+    
+    def remove(paths: List[str]) -> List[str]:
+        removed = []
+        for path in paths:
+            try:
+                os.remove(path)
+                removed.append(path)
+            except FileNotFoundError:
+                pass
+        return removed
+    
+    for entry, stat in _scan_files(output_dir):
+        if remaining is not None and remaining <= len(batch):
+            break
+        if stat.st_mtime < cutoff_time:
+            batch.append(entry.path)
+            if len(batch) >= batch_size:
+                removed = remove(batch)
+                batch = []
+                if remaining is not None:
+                    remaining -= len(removed)
+                yield removed
+    
+    if batch:
+        yield remove(batch)
 
 
-def clean_old_files(output_dir: str = "outputs", days_old: int = 30) -> int:
+def clean_old_files(
+    output_dir: str = "outputs",
+    days_old: int = 30,
+    max_files: Optional[int] = None
+) -> int:
     """
     Clean up old files from the output directory.
     
     Args:
         output_dir: Directory to clean
         days_old: Remove files older than this many days
+        max_files: Optional cap on files removed in this call
         
     Returns:
         Number of files removed
     """
-    if not os.path.exists(output_dir):
-        return 0
-    
-    current_time = datetime.now().timestamp()
-    cutoff_time = current_time - (days_old * 24 * 60 * 60)
-    
-    removed_count = 0
-    for filename in os.listdir(output_dir):
-        filepath = os.path.join(output_dir, filename)
-        if os.path.isfile(filepath):
-            file_time = os.path.getmtime(filepath)
-            if file_time < cutoff_time:
-                os.remove(filepath)
-                removed_count += 1
-    
-    return removed_count
+    return sum(len(batch) for batch in iter_clean_old_files(output_dir, days_old, max_files=max_files))
 
 
 def export_to_markdown(
@@ -227,14 +438,6 @@ def export_to_markdown(
     filepath = os.path.join(output_dir, filename)
     
     with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(f"# {title}\n\n")
-        f.write(f"*Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*\n\n")
-        f.write("---\n\n")
-        
-        for msg in conversation:
-            role = msg.get('role', 'unknown').title()
-            content = msg.get('content', '')
-            f.write(f"## {role}\n\n")
-            f.write(f"{content}\n\n")
+        f.writelines(iter_markdown(conversation, title))
     
     return filepath